@@ -0,0 +1,100 @@
+import io
+import mmap
+import os
+import wave
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Decoded Discord voice is 48 kHz stereo s16, delivered in 20 ms frames
+SAMPLE_RATE = 48000
+CHANNELS = 2
+SAMPLE_WIDTH = 2
+FRAME_MS = 20
+FRAME_BYTES = SAMPLE_RATE * CHANNELS * SAMPLE_WIDTH * FRAME_MS // 1000
+# Whisper resamples everything to 16 kHz mono anyway, so upload that
+TARGET_RATE = 16000
+DECIMATE = SAMPLE_RATE // TARGET_RATE
+PEAK = 0.9 * 32767
+MAX_GAIN = 20.0
+# Output samples conditioned per pass (10 s)
+BLOCK = TARGET_RATE * 10
+
+def _lowpass(taps=48):
+    # Windowed-sinc anti-alias filter with cutoff just below the new Nyquist
+    cutoff = 0.9 / DECIMATE / 2
+    n = np.arange(taps) - (taps - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return (h / h.sum()).astype(np.float32)
+
+_FILTER = _lowpass()
+
+def pcm_buffer(frames):
+    # Zero-copy view of whatever a sink holds for one speaker: a PCMBuffer,
+    # the path of a spooled one, AudioData, a BytesIO, raw bytes, or a list of
+    # frame chunks (the only case that copies).
+    if hasattr(frames, "file") and not hasattr(frames, "view"):
+        frames = frames.file
+    if hasattr(frames, "view"):
+        buf = frames.view()
+    elif isinstance(frames, str):
+        buf = _map_file(frames)
+    elif isinstance(frames, io.BytesIO):
+        buf = frames.getbuffer()
+    elif isinstance(frames, (bytes, bytearray, memoryview)):
+        buf = memoryview(frames)
+    else:
+        buf = memoryview(b"".join(frames))
+    # WaveSink rewrites its buffers as WAV files during cleanup; skip the header
+    if buf[:4] == b"RIFF":
+        pos = bytes(buf[:256]).find(b"data")
+        if pos != -1:
+            buf = buf[pos + 8:]
+    return buf[:len(buf) - len(buf) % (CHANNELS * SAMPLE_WIDTH)]
+
+def _map_file(path):
+    with open(path, "rb") as f:
+        if not os.fstat(f.fileno()).st_size:
+            return memoryview(b"")
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+def condition(pcm, block=BLOCK):
+    # 48 kHz stereo s16 -> 16 kHz mono s16: downmix, anti-alias + decimate, peak-normalize.
+    # Works through block output samples at a time so the float temporaries
+    # stay small however long the recording is.
+    samples = np.frombuffer(pcm, dtype="<i2").reshape(-1, CHANNELS)
+    taps = len(_FILTER)
+    kernel = _FILTER[::-1]
+    n_out = len(samples) // DECIMATE
+    out = np.empty(n_out, dtype=np.float32)
+    for k0 in range(0, n_out, block):
+        k1 = min(n_out, k0 + block)
+        # input for outputs k0..k1 plus the filter's history, zero before the start
+        lo = DECIMATE * k0 - (taps - 1)
+        mono = samples[max(0, lo):DECIMATE * (k1 - 1) + 1].mean(axis=1, dtype=np.float32)
+        if lo < 0:
+            mono = np.concatenate((np.zeros(-lo, dtype=np.float32), mono))
+        # FIR as a strided (zero-copy) window matrix times the taps; only the
+        # kept output samples are ever computed
+        out[k0:k1] = sliding_window_view(mono, taps)[::DECIMATE] @ kernel
+    peak = float(np.abs(out).max()) if n_out else 0.0
+    if peak > 0:
+        out *= min(PEAK / peak, MAX_GAIN)
+    return np.clip(out, -32768, 32767).astype("<i2")
+
+def encode_wav(samples, rate=TARGET_RATE):
+    buffer = io.BytesIO()
+    wf = wave.open(buffer, "wb")
+    wf.setnchannels(1)
+    wf.setsampwidth(SAMPLE_WIDTH)
+    wf.setframerate(rate)
+    wf.writeframes(memoryview(samples))
+    wf.close()
+    buffer.seek(0)
+    return buffer
+
+def wav_for_upload(frames):
+    buf = pcm_buffer(frames)
+    try:
+        return encode_wav(condition(buf))
+    finally:
+        buf.release()
@@ -0,0 +1,254 @@
+# Headless audits for exported debates, without Discord. Runs the same
+# pipeline as the bot (the local debate pre-check, ASSESS fused with the
+# summary when it fits, then the analysis) over files or directories and
+# appends one JSON line per transcript to the output file.
+#   python batch.py exports/ more.txt -o results.jsonl [--concurrency 20] [--workers 4]
+# Inputs:
+#   .txt    one transcript per file ("Name: message" lines)
+#   .json   a DiscordChatExporter export, or a list of {"author", "content"}
+#   .jsonl  one transcript per line: an object with "transcript", "text",
+#           "body" or "content", or with "messages" as in a .json export
+# The output doubles as the checkpoint: rerunning with the same -o skips
+# every transcript that already has a result and retries the failed ones
+# (readers should keep the last line per id).
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+EXTENSIONS = (".txt", ".json", ".jsonl")
+TEXT_FIELDS = ("transcript", "text", "body", "content")
+ID_FIELDS = ("id", "request_id")
+
+# What the local debate pre-check reads; the bot's stored messages have the same fields
+Message = collections.namedtuple("Message", "id author_id author_name bot content reply_to")
+
+def discover(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(EXTENSIONS):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+def _from_messages(messages):
+    msgs = []
+    for n, m in enumerate(messages):
+        author = author_id = m.get("author")
+        bot = False
+        if isinstance(author, dict):
+            bot = bool(author.get("isBot") or author.get("bot"))
+            author_id = author.get("id") or author.get("name")
+            author = author.get("nickname") or author.get("name")
+        reply_to = (m.get("reference") or {}).get("messageId")
+        msgs.append(Message(m.get("id", n), author_id, str(author), bot, (m.get("content") or "").strip(), reply_to))
+    return msgs
+
+def _from_text(text):
+    # "Name: message" lines; other lines continue the previous turn
+    from compact import split_turns
+    msgs = []
+    for n, turn in enumerate(split_turns(text)):
+        name, sep, content = turn.partition(": ")
+        if not sep:
+            name, content = "", turn
+        msgs.append(Message(n, name, name, False, content, None))
+    return msgs
+
+def _from_record(record):
+    if isinstance(record, list):
+        return _from_messages(record)
+    if "messages" in record:
+        return _from_messages(record["messages"])
+    return _from_text(next((record[k] for k in TEXT_FIELDS if isinstance(record.get(k), str)), ""))
+
+def _transcript(turns, message_tokens):
+    if message_tokens:
+        from compact import compact
+        return compact(turns, None, message_tokens)
+    from tokens import count_tokens
+    text = "\n".join(f"{name}: {content}" if name else content for name, content in turns)
+    n = count_tokens(text)
+    return text, (n, n)
+
+def parse_file(path, message_tokens):
+    # Runs in a worker process: read, normalize, compact (turns cut to
+    # message_tokens, or left whole if it is None), count tokens and pre-check;
+    # returns (item_id, transcript, (raw, compacted tokens), (debate, score))
+    # per transcript in the file. Workers import no config: the parent passes
+    # in the settings and the model name.
+    from detector import classify
+    if path.lower().endswith(".jsonl"):
+        items = []
+        with open(path, encoding="utf-8") as f:
+            for n, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                key = next((record[k] for k in ID_FIELDS if k in record), n) if isinstance(record, dict) else n
+                items.append((f"{path}#{key}", _from_record(record)))
+    elif path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            items = [(path, _from_record(json.load(f)))]
+    else:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            items = [(path, _from_text(f.read()))]
+    parsed = []
+    for item_id, msgs in items:
+        turns = [(m.author_name, m.content) for m in msgs if not m.bot and m.content]
+        transcript, tokens = _transcript(turns, message_tokens)
+        if transcript.strip():
+            parsed.append((item_id, transcript, tokens, classify(msgs)))
+    return parsed
+
+def load_checkpoint(path):
+    done = set()
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by an interrupted run
+                if not record.get("error"):
+                    done.add(record["id"])
+    return done
+
+async def audit(item, args):
+    import resilience
+    import summarize
+    from config import AUDIT_DEADLINE, DEBATE_PRECHECK
+    from detector import leans_debate
+    from prompts import SUMM_SYS, SUMM_USER, ANALYSIS_SYS, ANALYSIS_USER
+    item_id, transcript, (raw_tokens, tokens), (debate, score) = item
+    record = {"id": item_id, "tokens": tokens, "tokens_saved": raw_tokens - tokens}
+    start = time.perf_counter()
+    try:
+        # As in Discord: clear cases are settled locally, the rest by the model
+        if not DEBATE_PRECHECK:
+            debate = None
+        record["precheck"] = {True: "debate", False: "not_debate", None: "model"}[debate]
+        summary = None
+        if debate is None:
+            with resilience.deadline(AUDIT_DEADLINE):
+                debate, summary = await summarize.assess_and_summarize(transcript, None, leans_debate(score))
+        record["debate"] = debate
+        if debate or args.analyze_all:
+            with resilience.deadline(AUDIT_DEADLINE):
+                if summary is None:
+                    summary, record["analysis"] = await asyncio.gather(
+                        summarize.complete("summary", SUMM_SYS, SUMM_USER, transcript),
+                        summarize.complete("analysis", ANALYSIS_SYS, ANALYSIS_USER, transcript),
+                    )
+                else:
+                    # already written by the fused assess + summary call
+                    record["analysis"] = await summarize.complete("analysis", ANALYSIS_SYS, ANALYSIS_USER, transcript)
+            record["summary"] = summary
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - start, 2)
+    return record
+
+async def run(args):
+    import gateway
+    from config import COMPACT_MESSAGE_TOKENS, OPENAI_MODEL
+    from tokens import use_model
+    message_tokens = None if args.no_compact else COMPACT_MESSAGE_TOKENS
+    done = load_checkpoint(args.output)
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    stats = {"done": 0, "failed": 0, "skipped": 0, "files": 0}
+    started = time.perf_counter()
+    out = open(args.output, "a+", encoding="utf-8")
+    if out.tell():
+        # finish a line left half-written by an interrupted run
+        out.seek(out.tell() - 1)
+        if out.read(1) != "\n":
+            out.write("\n")
+
+    async def produce(pool):
+        # Parse files in the pool with a bounded number in flight, in input order
+        pending = []
+        for path in discover(args.paths):
+            pending.append(loop.run_in_executor(pool, parse_file, path, message_tokens))
+            if len(pending) >= args.workers * 2:
+                await feed(await pending.pop(0))
+        for fut in pending:
+            await feed(await fut)
+        for _ in range(args.concurrency):
+            await queue.put(None)
+
+    async def feed(items):
+        stats["files"] += 1
+        for item in items:
+            if item[0] in done:
+                stats["skipped"] += 1
+            else:
+                await queue.put(item)
+
+    async def consume():
+        while (item := await queue.get()) is not None:
+            record = await audit(item, args)
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            stats["failed" if "error" in record else "done"] += 1
+            total = stats["done"] + stats["failed"]
+            if total % args.progress == 0:
+                rate = total / (time.perf_counter() - started)
+                print(f"{total} audited ({stats['failed']} failed, {stats['skipped']} already done), "
+                      f"{rate:.2f}/s", file=sys.stderr)
+
+    try:
+        # spawned like the bot's workers; a fork would copy the gateway's open sessions
+        with ProcessPoolExecutor(
+            max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=use_model, initargs=(OPENAI_MODEL,),
+        ) as pool:
+            await asyncio.gather(produce(pool), *(consume() for _ in range(args.concurrency)))
+    finally:
+        out.close()
+        await gateway.close()
+    elapsed = time.perf_counter() - started
+    print(f"{stats['files']} files: {stats['done']} audited, {stats['failed']} failed, "
+          f"{stats['skipped']} skipped from checkpoint in {elapsed:.1f}s", file=sys.stderr)
+    return 1 if stats["failed"] else 0
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+", help="files or directories to audit")
+    parser.add_argument("-o", "--output", default="audits.jsonl", help="JSONL results and checkpoint")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("OPENAI_MAX_CONCURRENCY", "20")),
+                        help="transcripts audited at once")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes for parsing and token counting")
+    parser.add_argument("--analyze-all", action="store_true",
+                        help="summarize and analyze even when ASSESS finds no debate")
+    parser.add_argument("--no-compact", action="store_true", help="send transcripts without compaction")
+    parser.add_argument("--progress", type=int, default=10, help="report every N transcripts")
+    args = parser.parse_args()
+    # Everything runs under one (guild-less) limit; let it use the whole budget.
+    # Set before gateway is imported, since its semaphores are built on import.
+    os.environ["OPENAI_GUILD_CONCURRENCY"] = str(args.concurrency)
+    os.environ["OPENAI_MAX_CONCURRENCY"] = str(args.concurrency)
+    if not os.getenv("OPENAI_API_KEY"):
+        from dotenv import load_dotenv
+        load_dotenv()
+        if not os.getenv("OPENAI_API_KEY"):
+            print("ERROR: OPENAI_API_KEY not set.", file=sys.stderr)
+            return 2
+    try:
+        return asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("interrupted; rerun with the same --output to resume", file=sys.stderr)
+        return 130
+
+if __name__ == "__main__":
+    sys.exit(main())
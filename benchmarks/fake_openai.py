@@ -0,0 +1,158 @@
+# Local stand-in for the OpenAI HTTP API used by the load tests. Serves
+# /v1/chat/completions (plain and streamed) and /v1/audio/transcriptions with
+# configurable latency and injected failures, so runs cost nothing and are
+# repeatable.
+#   python benchmarks/fake_openai.py [--port 8089] [--latency 0.8] [--errors 0.02]
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prompts import ASSESS_SYS, ASSESS_SUMM_SYS, LIVE_STATE_SYS
+
+WORDS = (
+    "the claim rests on an assumption that neither side has supported with evidence "
+    "and the rebuttal shifts the burden instead of answering the original point"
+).split()
+
+class FakeOpenAI:
+    # latency: seconds before the first token; token_latency: seconds per
+    # generated token; jitter: +/- fraction applied to both; errors: share of
+    # requests answered with a 500 or a 429 carrying Retry-After
+    def __init__(self, latency=0.5, token_latency=0.01, jitter=0.3, errors=0.0,
+                 transcribe_latency=1.0, seed=0):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.jitter = jitter
+        self.errors = errors
+        self.transcribe_latency = transcribe_latency
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.failures = 0
+        self.runner = None
+
+    def _jittered(self, seconds):
+        return seconds * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _fault(self):
+        if self.rng.random() >= self.errors:
+            return None
+        self.failures += 1
+        if self.rng.random() < 0.5:
+            return web.json_response(
+                {"error": {"message": "injected rate limit", "type": "rate_limit_error"}},
+                status=429, headers={"Retry-After": "1"},
+            )
+        return web.json_response({"error": {"message": "injected failure", "type": "server_error"}}, status=500)
+
+    def _reply(self, system, max_tokens):
+        if system == ASSESS_SYS:
+            return ["YES"]
+        n = max(1, min(max_tokens, 400))
+        if system == ASSESS_SUMM_SYS:
+            text = json.dumps({"debate": True, "summary": " ".join(self.rng.choice(WORDS) for _ in range(n))})
+            return [text[i:i + 8] for i in range(0, len(text), 8)]
+        if system == LIVE_STATE_SYS:
+            text = json.dumps({
+                "segment_summary": " ".join(self.rng.choice(WORDS) for _ in range(n // 4)),
+                "summary": " ".join(self.rng.choice(WORDS) for _ in range(n // 4)),
+                "claims": {"Speaker": ["a claim"]},
+                "contested": ["a point"],
+                "unanswered": [],
+            })
+            return [text[i:i + 8] for i in range(0, len(text), 8)]
+        return [(" " if i else "") + self.rng.choice(WORDS) for i in range(n)]
+
+    async def chat(self, request):
+        self.requests += 1
+        body = await request.json()
+        fault = self._fault()
+        await asyncio.sleep(self._jittered(self.latency))
+        if fault is not None:
+            return fault
+        system = next((m["content"] for m in body["messages"] if m["role"] == "system"), "")
+        pieces = self._reply(system, body.get("max_tokens") or 256)
+        usage = {
+            "prompt_tokens": sum(len(m["content"]) for m in body["messages"]) // 4,
+            "completion_tokens": len(pieces),
+        }
+        created = int(time.time())
+        if not body.get("stream"):
+            await asyncio.sleep(self._jittered(self.token_latency * len(pieces)))
+            return web.json_response({
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created,
+                "model": body.get("model"), "usage": dict(usage, total_tokens=sum(usage.values())),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(pieces)}}],
+            })
+        resp = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await resp.prepare(request)
+        for piece in pieces:
+            await asyncio.sleep(self._jittered(self.token_latency))
+            chunk = {
+                "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                "model": body.get("model"),
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            await resp.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await resp.write(b"data: [DONE]\n\n")
+        await resp.write_eof()
+        return resp
+
+    async def transcribe(self, request):
+        self.requests += 1
+        data = await request.post()
+        upload = data.get("file")
+        size = len(upload.file.read()) if upload is not None else 0
+        fault = self._fault()
+        # Whisper time grows with the upload; 1 MB is roughly 30 s of 16 kHz speech
+        await asyncio.sleep(self._jittered(self.transcribe_latency * (0.5 + size / 2e6)))
+        if fault is not None:
+            return fault
+        words = max(1, size // 4000)
+        return web.json_response({"text": " ".join(self.rng.choice(WORDS) for _ in range(words))})
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self.chat)
+        app.router.add_post("/v1/audio/transcriptions", self.transcribe)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        port = self.runner.addresses[0][1]
+        return f"http://{host}:{port}/v1"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--transcribe-latency", type=float, default=1.0)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--errors", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeOpenAI(args.latency, args.token_latency, args.jitter, args.errors, args.transcribe_latency)
+
+    async def serve():
+        url = await server.start(args.host, args.port)
+        print(f"fake OpenAI listening on {url} (set OPENAI_API_BASE to use it)")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+# Minimal stand-ins for the discord.py objects the handlers touch, so the load
+# tests can drive on_message and process_audio_segment without a gateway
+# connection. Every send/edit/history call sleeps for `latency` to model the
+# Discord round trip.
+import asyncio
+import io
+import itertools
+import json
+import threading
+import time
+import numpy as np
+
+_ids = itertools.count(1 << 40)
+
+def snowflake():
+    return next(_ids)
+
+class FakeUser:
+    def __init__(self, name, bot=False, admin=False, user_id=None):
+        self.id = user_id or snowflake()
+        self.name = self.display_name = name
+        self.bot = bot
+        self.voice = None
+        self.guild_permissions = type("Permissions", (), {"administrator": admin})()
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+class FakeMessage:
+    def __init__(self, channel, author, content="", embeds=None, reference=None, mentions=()):
+        self.id = snowflake()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embeds = list(embeds or [])
+        self.reference = type("Reference", (), {"message_id": reference})() if reference else None
+        self.mentions = list(mentions)
+        self.attachments = []
+        self.edits = 0
+        self.failed = False
+
+    @property
+    def text(self):
+        return self.content or "\n".join(e.description or "" for e in self.embeds)
+
+    async def edit(self, content=None, embed=None, embeds=None):
+        await asyncio.sleep(self.channel.latency)
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+        if embeds is not None:
+            self.embeds = list(embeds)
+        self.edits += 1
+        self.channel.edits += 1
+        self.channel.check(self)
+
+    async def create_thread(self, name, auto_archive_duration=1440):
+        await asyncio.sleep(self.channel.latency)
+        return self.channel.guild.add_channel(name, parent=self.channel)
+
+class FakeChannel:
+    def __init__(self, guild, name, latency=0.05, parent=None):
+        self.id = snowflake()
+        self.guild = guild
+        self.name = name
+        self.latency = latency
+        self.parent = parent
+        self.messages = []  # oldest first
+        self.sent = 0
+        self.edits = 0
+        self.errors = 0
+
+    def post(self, author, content, **kwargs):
+        # Adds a message without any simulated latency (history replay)
+        message = FakeMessage(self, author, content, **kwargs)
+        self.messages.append(message)
+        return message
+
+    async def send(self, content=None, embed=None, embeds=None):
+        await asyncio.sleep(self.latency)
+        message = self.post(self.guild.me, content or "", embeds=embeds or ([embed] if embed else None))
+        self.sent += 1
+        self.check(message)
+        return message
+
+    def check(self, message):
+        # counts each bot message that ends up reporting an error once
+        if not message.failed and "error" in message.text.lower():
+            message.failed = True
+            self.errors += 1
+
+    async def fetch_message(self, message_id):
+        await asyncio.sleep(self.latency)
+        for message in self.messages:
+            if message.id == message_id:
+                return message
+        raise LookupError(message_id)
+
+    async def history(self, limit=100, before=None, after=None, oldest_first=None):
+        # Discord pages 100 messages per request
+        hi = before.id if before is not None else float("inf")
+        lo = after.id if after is not None else 0
+        window = [m for m in self.messages if lo < m.id < hi]
+        if oldest_first:
+            window = window[:limit]
+        else:
+            window = window[::-1][:limit]
+        for i, message in enumerate(window):
+            if i % 100 == 0:
+                await asyncio.sleep(self.latency)
+            yield message
+
+class FakeGuild:
+    def __init__(self, me, latency=0.05):
+        self.id = snowflake()
+        self.me = me
+        self.latency = latency
+        self.channels = {}
+        self.members = {}
+
+    def add_channel(self, name, parent=None):
+        channel = FakeChannel(self, name, self.latency, parent)
+        self.channels[channel.id] = channel
+        return channel
+
+    def add_member(self, name):
+        member = FakeUser(name)
+        self.members[member.id] = member
+        return member
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+class FakeClient:
+    def __init__(self):
+        self.user = FakeUser("DebateAuditor", bot=True)
+        self.guilds = []
+
+    def add_guild(self, latency=0.05):
+        guild = FakeGuild(self.user, latency)
+        self.guilds.append(guild)
+        return guild
+
+    def get_channel(self, channel_id):
+        for guild in self.guilds:
+            if channel_id in guild.channels:
+                return guild.channels[channel_id]
+        return None
+
+class FakeAudioData:
+    # What a finished WaveSink holds per speaker
+    def __init__(self, pcm):
+        self.file = io.BytesIO(pcm)
+
+class FakeSink:
+    def __init__(self, audio):
+        self.audio_data = {user_id: FakeAudioData(pcm) for user_id, pcm in audio.items()}
+
+class FakeVoiceClient:
+    # Feeds synthetic PCM for each member into the sink from a background
+    # thread, the way the voice receive thread does
+    def __init__(self, guild, speakers, speed=1.0, channel=None):
+        self.guild = guild
+        self.channel = channel or guild.add_channel("Debate room")
+        self.speakers = speakers
+        self.speed = speed
+        self.sink = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._callback = None
+
+    def start_recording(self, sink, callback, *args):
+        from audio import FRAME_BYTES, FRAME_MS
+        self.sink = sink
+        self._callback = (callback, args, asyncio.get_running_loop())
+        self._stop.clear()
+        streams = {member.id: synthetic_pcm(600, seed=i) for i, member in enumerate(self.speakers)}
+
+        def feed():
+            pos = 0
+            while not self._stop.is_set():
+                for user_id, pcm in streams.items():
+                    frame = pcm[pos % len(pcm):pos % len(pcm) + FRAME_BYTES]
+                    if len(frame) == FRAME_BYTES:
+                        sink.write(frame, user_id)
+                pos += FRAME_BYTES
+                time.sleep(FRAME_MS / 1000 / self.speed)
+
+        self._thread = threading.Thread(target=feed, daemon=True)
+        self._thread.start()
+
+    def stop_recording(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.sink.cleanup()
+        callback, args, loop = self._callback
+        loop.create_task(callback(self.sink, *args))
+
+    async def disconnect(self):
+        self._stop.set()
+
+def synthetic_pcm(seconds, seed=0):
+    # 48 kHz stereo s16: speech-band noise in bursts of 1-4 s with pauses between
+    from audio import SAMPLE_RATE
+    rng = np.random.default_rng(seed)
+    n = int(SAMPLE_RATE * seconds)
+    envelope = np.zeros(n, dtype=np.float32)
+    pos = 0
+    while pos < n:
+        talk = int(rng.uniform(1, 4) * SAMPLE_RATE)
+        envelope[pos:pos + talk] = 1
+        pos += talk + int(rng.uniform(0.8, 2) * SAMPLE_RATE)
+    mono = (rng.standard_normal(n).astype(np.float32) * 3000 * envelope).astype("<i2")
+    return np.repeat(mono, 2).tobytes()
+
+def synthetic_opus(seconds, seed=0):
+    # Opus-shaped packets for the same talk/pause pattern as synthetic_pcm:
+    # CELT fullband 20 ms stereo TOC byte and 60-160 byte payloads while
+    # talking, nothing during pauses (Discord stops sending). Not decodable.
+    rng = np.random.default_rng(seed)
+    frames = int(seconds * 50)
+    packets = []
+    pos = 0
+    while pos < frames:
+        talk = int(rng.uniform(1, 4) * 50)
+        for _ in range(min(talk, frames - pos)):
+            packets.append(b"\xfc" + rng.bytes(int(rng.integers(60, 160))))
+        pos += talk + int(rng.uniform(0.8, 2) * 50)
+    return packets
+
+def load_history(path):
+    # A JSON list of {"author": name, "content": text}, or a DiscordChatExporter
+    # export ({"messages": [{"author": {"name": ...}, "content": ...}]})
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("messages", [])
+    history = []
+    for m in data:
+        author = m.get("author")
+        if isinstance(author, dict):
+            author = author.get("nickname") or author.get("name")
+        history.append((str(author), m.get("content", "")))
+    return history
+
+def synthetic_history(n, seed=0):
+    rng = np.random.default_rng(seed)
+    words = (
+        "evidence suggests the policy reduced costs but your source ignores the"
+        " counterfactual and the sample is too small to support that claim"
+    ).split()
+    return [
+        (("Alice", "Bob")[i % 2], " ".join(rng.choice(words, size=int(rng.integers(8, 40)))))
+        for i in range(n)
+    ]
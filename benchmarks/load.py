@@ -0,0 +1,222 @@
+# Load test: drives the real handlers at N concurrent guilds against the fake
+# OpenAI server and fake Discord objects, then reports throughput, latency
+# percentiles and peak RSS.
+#   python benchmarks/load.py text  [--guilds 20] [--audits 3] [--history history.json]
+#   python benchmarks/load.py voice [--guilds 10] [--rooms 1] [--segments 3] [--speakers 3] [--seconds 60] [--opus]
+# Common knobs: --latency/--token-latency/--transcribe-latency/--errors for the
+# model server, --discord-latency for Discord round trips and --workers for
+# the CPU worker processes.
+import argparse
+import asyncio
+import importlib
+import os
+import resource
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules import each other by name, as when bot.py runs from the repo root
+sys.path.insert(0, ROOT)
+# Fresh in-memory state for every run: no response cache or history on disk
+os.environ["CACHE_PATH"] = ""
+os.environ["HISTORY_PATH"] = ""
+os.environ["SESSION_LOG"] = ""
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+import openai
+from fake_openai import FakeOpenAI
+from fakes import (
+    FakeClient, FakeVoiceClient, load_history, synthetic_history, synthetic_opus, synthetic_pcm,
+)
+
+def handlers(name):
+    return importlib.import_module(f"handlers.{name}")
+
+def percentiles(samples):
+    if not samples:
+        return "n=0"
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(q * len(s)))]
+    return f"n={len(s)} p50={pick(0.5):.2f}s p95={pick(0.95):.2f}s p99={pick(0.99):.2f}s max={s[-1]:.2f}s"
+
+async def loop_lag(samples, interval=0.05):
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(loop.time() - t0 - interval)
+
+async def text_scenario(args, client):
+    text = handlers("text")
+    config = importlib.import_module("config")
+    scheduler_mod = importlib.import_module("scheduler")
+    history = load_history(args.history) if args.history else synthetic_history(args.messages)
+    latencies = {"audit": [], "analyze": []}
+
+    async def dispatch(message):
+        # Same path as bot.on_message: record, filter, then the shared scheduler
+        text.history_store.record(message)
+        if not text.is_relevant(message, client):
+            return
+        await config.scheduler.run(
+            message.guild.id, scheduler_mod.PRIORITY_TEXT, text.on_message, message, client,
+        )
+
+    async def guild_run(g):
+        guild = client.add_guild(args.discord_latency)
+        channel = guild.add_channel("debate")
+        # names carry the guild number so guilds never share cached replies
+        speakers = {}
+        for name, content in history:
+            author = speakers.get(name) or speakers.setdefault(name, guild.add_member(f"{name}-{g}"))
+            channel.post(author, content)
+        auditor = guild.add_member(f"auditor-{g}")
+        for _ in range(args.audits):
+            last = channel.messages[-1]
+            trigger = channel.post(
+                auditor, f"{client.user.mention} audit please", reference=last.id, mentions=[client.user],
+            )
+            t0 = time.perf_counter()
+            await dispatch(trigger)
+            latencies["audit"].append(time.perf_counter() - t0)
+            thread = next((c for c in guild.channels.values() if c.parent is channel and c.messages), None)
+            if thread is None:
+                continue
+            await asyncio.sleep(args.think)  # the user reads the summary
+            reply = thread.post(auditor, "ANALYZE")
+            t0 = time.perf_counter()
+            await dispatch(reply)
+            latencies["analyze"].append(time.perf_counter() - t0)
+            thread.parent = None  # the next audit opens a new thread
+            # new messages so the next audit is not a cache hit
+            for name, content in history[:10]:
+                channel.post(speakers[name], f"{content} ({len(channel.messages)})")
+
+    await asyncio.gather(*(guild_run(g) for g in range(args.guilds)))
+    return latencies, args.guilds * args.audits * 2
+
+async def voice_scenario(args, client):
+    voice = handlers("voice")
+    config = importlib.import_module("config")
+    session_store = importlib.import_module("session_store")
+    transcript = importlib.import_module("transcript")
+    live_state = importlib.import_module("live_state")
+    recording = importlib.import_module("recording")
+    from audio import FRAME_BYTES
+    latencies = {"segment": []}
+    if args.busy_speakers:
+        latencies["busy"] = []  # the first room of each guild
+    # one recording per speaker, shared by all rooms
+    speakers = max(args.speakers, args.busy_speakers)
+    if args.opus:
+        audio = [synthetic_opus(args.seconds, seed=i) for i in range(speakers)]
+    else:
+        pcm = [synthetic_pcm(args.seconds, seed=i) for i in range(speakers)]
+
+    async def room_run(guild, g, r):
+        busy = args.busy_speakers and r == 0
+        members = [guild.add_member(f"speaker{i}-{g}-{r}") for i in range(args.busy_speakers if busy else args.speakers)]
+        thread = guild.add_channel(f"DEBATE LIVE NOTES - room {r}")
+        session = session_store.LiveSession(
+            FakeVoiceClient(guild, members, channel=guild.add_channel(f"room {r}")), thread,
+            live_state.empty_state(), asyncio.Lock(), asyncio.Event(), transcript.Transcript(),
+        )
+        config.live_sessions[session.room] = session
+        for _ in range(args.segments):
+            # each guild records its own copy, frame by frame, as the receive
+            # thread would, so the audio buffers (and any spooling) are real
+            segments = []
+            if args.opus:
+                sink = recording.OpusSegmentSink(segments.append)
+                for i, m in enumerate(members):
+                    for seq, packet in enumerate(audio[i]):
+                        sink.write_packet(i, m.id, seq, packet)
+                    await asyncio.sleep(0)
+            else:
+                sink = recording.SegmentSink(segments.append)
+                for i, m in enumerate(members):
+                    for pos in range(0, len(pcm[i]), FRAME_BYTES * 50):
+                        sink.write(pcm[i][pos:pos + FRAME_BYTES * 50], m.id)
+                    await asyncio.sleep(0)
+            sink.rotate()
+            t0 = time.perf_counter()
+            await voice.process_audio_segment(segments[0], session.room)
+            latencies["busy" if busy else "segment"].append(time.perf_counter() - t0)
+        config.live_sessions.pop(session.room, None)
+        session.full_transcript.close()
+
+    async def guild_run(g):
+        guild = client.add_guild(args.discord_latency)
+        await asyncio.gather(*(room_run(guild, g, r) for r in range(args.rooms)))
+
+    await asyncio.gather(*(guild_run(g) for g in range(args.guilds)))
+    return latencies, args.guilds * args.rooms * args.segments
+
+async def run(args):
+    server = FakeOpenAI(
+        args.latency, args.token_latency, args.jitter, args.errors, args.transcribe_latency,
+    )
+    openai.api_base = await server.start()
+    client = FakeClient()
+    scenario = text_scenario if args.scenario == "text" else voice_scenario
+    workers = importlib.import_module("workers")
+    workers.pool.start()
+    await workers.pool.run(int)  # wait until the workers are up
+    lag = []
+    probe = asyncio.create_task(loop_lag(lag))
+    t0 = time.perf_counter()
+    try:
+        latencies, ops = await scenario(args, client)
+    finally:
+        wall = time.perf_counter() - t0
+        probe.cancel()
+        await importlib.import_module("gateway").close()
+        workers.pool.close()
+        await server.stop()
+    channels = [c for guild in client.guilds for c in guild.channels.values()]
+    print(f"{args.scenario}: {args.guilds} guilds, {ops} operations in {wall:.1f}s "
+          f"-> {ops / wall:.2f} ops/s")
+    for name, samples in latencies.items():
+        print(f"  {name:<8} {percentiles(samples)}")
+    # how late a 50 ms timer fires: what the Discord heartbeat and every
+    # other event waits on while the loop is busy
+    print(f"  loop lag {percentiles(lag)}")
+    print(f"  model requests {server.requests} (injected failures {server.failures}), "
+          f"discord sends {sum(c.sent for c in channels)}, edits {sum(c.edits for c in channels)}, "
+          f"error replies {sum(c.errors for c in channels)}")
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"  peak RSS {rss / (1 << 20 if sys.platform == 'darwin' else 1 << 10):.1f} MB")
+    if args.stages:
+        print(importlib.import_module("metrics").registry.summary())
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("scenario", choices=("text", "voice"))
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--audits", type=int, default=3, help="audits per guild (text)")
+    parser.add_argument("--messages", type=int, default=150, help="synthetic history length (text)")
+    parser.add_argument("--history", help="recorded history JSON to replay instead (text)")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds before replying ANALYZE (text)")
+    parser.add_argument("--rooms", type=int, default=1, help="concurrent debate rooms per guild (voice)")
+    parser.add_argument("--segments", type=int, default=3, help="segments per room (voice)")
+    parser.add_argument("--speakers", type=int, default=3, help="speakers per room (voice)")
+    parser.add_argument("--busy-speakers", type=int, default=0,
+                        help="speakers in the first room of each guild, to check it does not slow the others (voice)")
+    parser.add_argument("--seconds", type=int, default=60, help="audio per speaker per segment (voice)")
+    parser.add_argument("--opus", action="store_true", help="record Opus packets for Ogg passthrough (voice)")
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--transcribe-latency", type=float, default=1.0)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--errors", type=float, default=0.0)
+    parser.add_argument("--discord-latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, help="worker processes for CPU stages (0 = threads)")
+    parser.add_argument("--stages", action="store_true", help="also print the per-stage metrics")
+    args = parser.parse_args()
+    if args.workers is not None:
+        os.environ["WORKER_PROCESSES"] = str(args.workers)
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
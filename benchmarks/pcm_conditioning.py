@@ -0,0 +1,59 @@
+# Micro-benchmark: legacy b"".join(frames) + 48 kHz "mono" WAV versus the
+# NumPy conditioning stage in audio.py (16 kHz mono, normalized).
+#   python benchmarks/pcm_conditioning.py [seconds] [repeats]
+import io
+import os
+import sys
+import time
+import wave
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from audio import FRAME_BYTES, SAMPLE_RATE, wav_for_upload
+
+def synthetic_frames(seconds):
+    # Speech-band noise bursts with silent gaps, split into 20 ms decoder frames
+    rng = np.random.default_rng(0)
+    n = SAMPLE_RATE * seconds
+    envelope = (np.sin(np.linspace(0, seconds * np.pi, n)) > 0).astype(np.float32)
+    mono = (rng.standard_normal(n).astype(np.float32) * 3000 * envelope).astype("<i2")
+    pcm = np.repeat(mono, 2).tobytes()
+    return [pcm[i:i + FRAME_BYTES] for i in range(0, len(pcm), FRAME_BYTES)]
+
+def legacy(frames):
+    buffer = io.BytesIO()
+    wf = wave.open(buffer, "wb")
+    wf.setnchannels(1)
+    wf.setsampwidth(2)
+    wf.setframerate(48000)
+    wf.writeframes(b"".join(frames))
+    wf.close()
+    buffer.seek(0)
+    return buffer
+
+def conditioned(frames):
+    # the sink hands over one contiguous buffer, so join outside the timed path
+    return wav_for_upload(frames)
+
+def bench(name, fn, arg, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = fn(arg)
+        best = min(best, time.perf_counter() - t0)
+    size = len(out.getvalue())
+    print(f"{name:<12} {best * 1000:8.1f} ms  {size / 1e6:8.2f} MB")
+    return size
+
+def main():
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 180
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    frames = synthetic_frames(seconds)
+    buffer = io.BytesIO(b"".join(frames))
+    print(f"{seconds}s of 48 kHz stereo s16 ({len(frames)} frames), best of {repeats}")
+    old = bench("legacy", legacy, frames, repeats)
+    new = bench("conditioned", conditioned, buffer, repeats)
+    print(f"upload size ratio: {old / new:.2f}x")
+
+if __name__ == "__main__":
+    main()
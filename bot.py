@@ -7,19 +7,57 @@ from handlers.voice import live_recording, process_audio_segment
 async def on_ready():
     print(f"DebateAuditor online as {client.user} (ID: {client.user.id})")
 
-from config import client
+from config import client, sessions, scheduler, METRICS_HOST, METRICS_PORT
+from scheduler import PRIORITY_TEXT
+import metrics
+import workers
+from voicebots import voice_bots
 from handlers.text import on_message as text_on_message
+from handlers.text import on_raw_message_edit as text_on_raw_message_edit
+from handlers.text import on_raw_message_delete as text_on_raw_message_delete
+from handlers.text import history_store, is_relevant
 from handlers.voice import live_recording, process_audio_segment
 
+_metrics_server = None
+
 @client.event
-def on_ready():
+async def on_ready():
+    global _metrics_server
+    # A fresh gateway session may have missed messages; stop trusting live coverage
+    history_store.reset_live()
+    # on_ready fires again after every reconnect; the endpoint and the worker
+    # processes only start once
+    if METRICS_PORT and _metrics_server is None:
+        _metrics_server = await metrics.serve(METRICS_HOST, METRICS_PORT)
+    workers.pool.start()
+    voice_bots.start()
     print(f"DebateAuditor online as {client.user} (ID: {client.user.id})")
 
 @client.event
-def on_message(message):
+async def on_message(message):
+    history_store.record(message)
+    if not is_relevant(message, client):
+        return
+    if message.content.lower().startswith(("!enddebate", "!stats")):
+        # !enddebate waits on its own live segment jobs, so it must not hold a
+        # scheduler slot; !stats has to answer even when the queues are full
+        await text_on_message(message, client)
+        return
     # Only dispatch text commands; voice commands are invoked by text handler as needed
-    import asyncio
-    asyncio.create_task(text_on_message(message, client))
+    guild_id = message.guild.id if message.guild else None
+    position = scheduler.submit(guild_id, PRIORITY_TEXT, text_on_message, message, client)
+    if position is None:
+        await message.channel.send("⚠️ Too many audits are waiting in this server right now. Please try again shortly.")
+    elif position:
+        await message.channel.send(f"⏳ Busy right now — queued, position {position}.")
+
+@client.event
+async def on_raw_message_edit(payload):
+    await text_on_raw_message_edit(payload)
+
+@client.event
+async def on_raw_message_delete(payload):
+    await text_on_raw_message_delete(payload)
 
 if __name__ == "__main__":
     import os
@@ -27,6 +65,8 @@ if __name__ == "__main__":
     if not token:
         print("ERROR: DISCORD_TOKEN not set.")
         exit(1)
+    # Only this process writes SESSION_LOG; shrink it once at startup
+    sessions.compact()
     client.run(token)
             if not m.author.bot:
                 msgs.append(m)
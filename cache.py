@@ -0,0 +1,87 @@
+import asyncio
+import collections
+import hashlib
+import sqlite3
+import threading
+import time
+from config import CACHE_SIZE, CACHE_TTL, CACHE_PATH
+
+def cache_key(model, system, user, max_tokens):
+    h = hashlib.sha256()
+    for part in (model, system, user, str(max_tokens)):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+class ResponseCache:
+    # Content-addressed model responses: a bounded in-memory LRU in front of an
+    # optional SQLite table. Entries expire after ttl seconds in both tiers.
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL, path=CACHE_PATH):
+        self.size = size
+        self.ttl = ttl
+        self.memory = collections.OrderedDict()  # key -> (expires, value)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.db = None
+        self.lock = threading.Lock()
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)")
+            self._purge()
+
+    async def get(self, key):
+        entry = self.memory.get(key)
+        if entry and entry[0] > time.time():
+            self.memory.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry:
+            del self.memory[key]
+        if self.db is not None:
+            row = await asyncio.to_thread(self._load, key)
+            if row:
+                self._remember(key, row[1], row[0])
+                self.hits += 1
+                self.disk_hits += 1
+                return row[1]
+        self.misses += 1
+        return None
+
+    async def put(self, key, value):
+        expires = time.time() + self.ttl
+        self._remember(key, value, expires)
+        if self.db is not None:
+            await asyncio.to_thread(self._store, key, value, expires)
+
+    def _remember(self, key, value, expires):
+        self.memory[key] = (expires, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+    def _load(self, key):
+        with self.lock:
+            return self.db.execute(
+                "SELECT expires, value FROM responses WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+
+    def _store(self, key, value, expires):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires) VALUES (?, ?, ?)",
+                (key, value, expires),
+            )
+            self.writes += 1
+            if self.writes % 100 == 0:
+                self.db.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+            self.db.commit()
+
+    def _purge(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),))
+            self.db.commit()
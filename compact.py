@@ -0,0 +1,122 @@
+import re
+from tokens import count_tokens
+
+# Transcript compaction: strips chat noise that costs tokens on every prompt
+# without telling the model anything about the argument, merges consecutive
+# messages from one speaker into a single turn, and shortens long pastes while
+# keeping the sentences most likely to be quoted.
+
+_URL = re.compile(r"<?https?://([^/\s>]+)[^\s>]*>?")
+_CUSTOM_EMOJI = re.compile(r"<a?:(\w+):\d+>")
+_USER_MENTION = re.compile(r"<@!?\d+>")
+_CHANNEL_MENTION = re.compile(r"<#\d+>")
+_ROLE_MENTION = re.compile(r"<@&\d+>")
+_TIMESTAMP = re.compile(r"<t:\d+(?::\w)?>")
+_SPACES = re.compile(r"[ \t]+")
+# letter and punctuation runs ("sooooo", "!!!!!"); never digits, "10000" is a figure
+_REPEAT = re.compile(r"([^\d\s])\1{3,}")
+_FENCE = re.compile(r"```(\w*)\n?(.*?)```", re.DOTALL)
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+# Messages that are nothing but a reaction; a bare "?" is a real turn in a debate
+_NOISE = re.compile(
+    r"^(?:l+o+l+|lmf?a+o+|rofl|xd+|ha(?:ha)+h?|he(?:he)+|\+1|-1|(?::\w+:\s*)+|[^\w\s?]+)$",
+    re.IGNORECASE,
+)
+# Sentences worth keeping when a long message is cut: figures, quotes, pushback
+_QUOTABLE = re.compile(
+    r"\d|\"|“|\b(because|evidence|source|but|however|wrong|therefore|means|proves?)\b", re.IGNORECASE
+)
+# A speaker turn starts with "Name: "; other lines continue the previous turn
+TURN = re.compile(r"^[^:\n]{1,80}: ")
+CODE_LINES = 6
+
+def normalize(content):
+    text = _URL.sub(lambda m: f"<{m.group(1)}>", content)
+    text = _CUSTOM_EMOJI.sub(r":\1:", text)
+    text = _USER_MENTION.sub("@user", text)
+    text = _ROLE_MENTION.sub("@role", text)
+    text = _CHANNEL_MENTION.sub("#channel", text)
+    text = _TIMESTAMP.sub("<time>", text)
+    text = _REPEAT.sub(r"\1\1\1", text)
+    text = _FENCE.sub(_shorten_code, text)
+    # quoted lines repeat someone else's earlier message
+    lines = [line for line in text.splitlines() if not line.lstrip().startswith(">")]
+    return _SPACES.sub(" ", " ".join(line.strip() for line in lines if line.strip())).strip()
+
+def _shorten_code(match):
+    lang, body = match.group(1), match.group(2).strip("\n").splitlines()
+    if len(body) > CODE_LINES:
+        head, tail = body[:CODE_LINES // 2], body[-(CODE_LINES // 2):]
+        body = head + [f"[... {len(body) - len(head) - len(tail)} lines omitted ...]"] + tail
+    return f"```{lang} " + " | ".join(line.strip() for line in body) + " ```"
+
+def is_noise(text):
+    return not text or _NOISE.match(text) is not None
+
+def shorten(text, limit):
+    # Keep the first and last sentence plus quotable ones, in order, up to limit tokens
+    if count_tokens(text) <= limit:
+        return text
+    sentences = _SENTENCE.split(text)
+    if len(sentences) < 3:
+        words = text.split()
+        keep = max(1, len(words) * limit // max(1, count_tokens(text)))
+        return " ".join(words[:keep]) + " [...]"
+    must = {0, len(sentences) - 1}
+    ranked = sorted(must) + [i for i in range(1, len(sentences) - 1) if _QUOTABLE.search(sentences[i])]
+    kept, size = set(), 0
+    for i in ranked:
+        n = count_tokens(sentences[i]) + 1
+        if size + n > limit and kept:
+            continue
+        kept.add(i)
+        size += n
+    out, gap = [], False
+    for i, sentence in enumerate(sentences):
+        if i in kept:
+            out.append(sentence)
+            gap = False
+        elif not gap:
+            out.append("[...]")
+            gap = True
+    return " ".join(out)
+
+def split_turns(transcript):
+    turns = []
+    for line in transcript.splitlines():
+        if not line.strip():
+            continue
+        if turns and not TURN.match(line):
+            turns[-1] += "\n" + line
+        else:
+            turns.append(line)
+    return turns
+
+def merge_turns(turns):
+    merged = []
+    for name, text in turns:
+        if merged and merged[-1][0] == name:
+            merged[-1][1].append(text)
+        else:
+            merged.append((name, [text]))
+    return [(name, " ".join(parts)) for name, parts in merged]
+
+def compact(turns, budget, message_tokens, floor=40):
+    # turns: (speaker, content) oldest first; turns are cut to message_tokens
+    # (COMPACT_MESSAGE_TOKENS, passed in so worker processes need no config).
+    # Returns the transcript and (tokens before, tokens after). With a budget,
+    # long turns are cut harder (down to floor tokens each) until it fits.
+    turns = list(turns)
+    before = count_tokens("\n".join(f"{name}: {content}" for name, content in turns))
+    cleaned = merge_turns(
+        (name, text) for name, text in ((name, normalize(content)) for name, content in turns)
+        if not is_noise(text)
+    )
+    limit = message_tokens
+    while True:
+        lines = [f"{name}: {shorten(text, limit)}" for name, text in cleaned]
+        transcript = "\n".join(lines)
+        after = count_tokens(transcript)
+        if budget is None or after <= budget or limit <= floor:
+            return transcript, (before, after)
+        limit = max(floor, limit // 2)
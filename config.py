@@ -1,16 +1,157 @@
 import os
 from dotenv import load_dotenv
 import discord
+from session_store import SessionStore, AuditSession, LiveSession
+from scheduler import Scheduler
+import metrics
 
 # Load environment variables from .env file if present
 load_dotenv()
 
-# In-memory sessions for multi-step audits: keyed by (channel_id, user_id)
-sessions = {}
-# In-memory live debate voice sessions: keyed by guild_id
-live_sessions = {}
+# Audit session limits; SESSION_LOG is an optional append log to survive restarts
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(24 * 3600)))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+SESSION_LOG = os.getenv("SESSION_LOG", "")
+
+# Sessions for multi-step audits: keyed by (channel_id, user_id)
+sessions = SessionStore(
+    AuditSession, ttl=SESSION_TTL, max_entries=SESSION_MAX, max_bytes=SESSION_MAX_BYTES, path=SESSION_LOG,
+)
+# Live debate voice sessions: keyed by voice channel id, several per guild
+live_sessions = SessionStore(LiveSession)
+
+# Handler scheduling: max concurrent handler jobs and waiting jobs per guild
+SCHEDULER_MAX_IN_FLIGHT = int(os.getenv("SCHEDULER_MAX_IN_FLIGHT", "16"))
+SCHEDULER_GUILD_QUEUE = int(os.getenv("SCHEDULER_GUILD_QUEUE", "10"))
+scheduler = Scheduler(SCHEDULER_MAX_IN_FLIGHT, SCHEDULER_GUILD_QUEUE)
+metrics.collector("scheduler_jobs", "gauge", "Handler jobs running or waiting in the scheduler.", lambda: {
+    k: v for k, v in scheduler.stats().items() if k in ("in_flight", "queued_live", "queued_text")
+}, label="state")
+metrics.collector("sessions", "gauge", "Open audit and live debate sessions.", lambda: {
+    "audit": len(sessions), "live": len(live_sessions),
+}, label="kind")
 
 # Configure Discord intents
 intents = discord.Intents.default()
 intents.message_content = True
-client = discord.Client(intents=intents)
+# DISCORD_SHARDS: empty for a single connection, "auto" for Discord's
+# recommended shard count, or a number. DISCORD_SHARD_IDS ("0,1") runs only
+# those shards, to split one bot across several processes or hosts.
+DISCORD_SHARDS = os.getenv("DISCORD_SHARDS", "")
+DISCORD_SHARD_IDS = [int(i) for i in os.getenv("DISCORD_SHARD_IDS", "").split(",") if i.strip()]
+if DISCORD_SHARDS:
+    client = discord.AutoShardedClient(
+        intents=intents,
+        shard_count=None if DISCORD_SHARDS == "auto" else int(DISCORD_SHARDS),
+        shard_ids=DISCORD_SHARD_IDS or None,
+    )
+else:
+    client = discord.Client(intents=intents)
+# Discord allows a bot account one voice connection per server. Each extra
+# token (comma-separated) is another account that can record one more room
+# at a time in every server it has been invited to.
+VOICE_BOT_TOKENS = [t.strip() for t in os.getenv("VOICE_BOT_TOKENS", "").split(",") if t.strip()]
+
+# Processes for CPU-bound work (audio conditioning, transcript compaction);
+# 0 runs it in threads of the gateway process
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", str(min(4, os.cpu_count() or 1))))
+
+# OpenAI gateway settings (used by gateway.py for every model call)
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "whisper-1")
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "32"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "20"))
+OPENAI_GUILD_CONCURRENCY = int(os.getenv("OPENAI_GUILD_CONCURRENCY", "8"))
+# Failed calls are retried up to OPENAI_RETRIES times with jittered backoff
+# (never sooner than a 429's Retry-After) while the step's deadline allows:
+# AUDIT_DEADLINE seconds for each audit step and the final verdict, one
+# segment length for live segment work. After BREAKER_FAILURES server-side
+# failures in a row an endpoint fails fast for BREAKER_COOLDOWN seconds.
+AUDIT_DEADLINE = float(os.getenv("AUDIT_DEADLINE", "120"))
+OPENAI_RETRIES = int(os.getenv("OPENAI_RETRIES", "3"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "8"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))
+# Latency-critical kinds send a duplicate request once the first has run past
+# the kind's p95 (known after HEDGE_MIN_SAMPLES calls); never for streamed replies
+HEDGE_KINDS = tuple(k for k in os.getenv("HEDGE_KINDS", "live_state,whisper").split(",") if k)
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+# max_tokens per prompt kind
+MAX_TOKENS = {
+    "assess": 5,
+    "assess_summary": 230,
+    "summary": 200,
+    "expand_summary": 300,
+    "analysis": 500,
+    "live_state": 700,
+    "chunk": 300,
+    "merge": 400,
+}
+# Settle obvious debate / not-a-debate cases locally before asking the model
+DEBATE_PRECHECK = os.getenv("DEBATE_PRECHECK", "1") == "1"
+# Context window of OPENAI_MODEL; longer transcripts go through map-reduce
+MODEL_CONTEXT_TOKENS = int(os.getenv("MODEL_CONTEXT_TOKENS", "4096"))
+# Size of each transcript chunk summarized in the map step
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "2000"))
+
+# Live voice recording settings
+LIVE_SEGMENT_SECONDS = int(os.getenv("LIVE_SEGMENT_SECONDS", "180"))
+# Concurrent per-speaker transcriptions across all live sessions, shared out
+# round-robin between rooms
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", "6"))
+# Stream utterances through the VAD sink instead of rotating a WaveSink
+LIVE_VAD = os.getenv("LIVE_VAD", "1") == "1"
+VAD_THRESHOLD = int(os.getenv("VAD_THRESHOLD", "500"))  # RMS of s16 samples
+VAD_SILENCE_MS = int(os.getenv("VAD_SILENCE_MS", "700"))
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "300"))
+VAD_MAX_UTTERANCE_MS = int(os.getenv("VAD_MAX_UTTERANCE_MS", "30000"))
+VAD_PREROLL_MS = int(os.getenv("VAD_PREROLL_MS", "200"))
+# Upload the received Opus packets in Ogg instead of decoding to PCM and
+# sending WAV; records rotating LIVE_SEGMENT_SECONDS segments (no VAD, which
+# needs the decoded audio)
+LIVE_OPUS = os.getenv("LIVE_OPUS", "0") == "1"
+
+# Model response cache (memory LRU + SQLite); set CACHE_PATH="" to keep it in memory only
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "256"))
+CACHE_TTL = int(os.getenv("CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_PATH = os.getenv("CACHE_PATH", "debateauditor_cache.sqlite3")
+# Prompt kinds whose responses are cached; live segment summaries never repeat
+CACHE_KINDS = ("assess", "assess_summary", "summary", "expand_summary", "analysis", "chunk", "merge")
+
+# Channel history store; set HISTORY_PATH to a file to persist it in SQLite
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "5000"))
+HISTORY_MAX_CHANNELS = int(os.getenv("HISTORY_MAX_CHANNELS", "200"))
+HISTORY_PATH = os.getenv("HISTORY_PATH", "")
+
+# Transcript compaction before prompting; long turns are cut to about
+# COMPACT_MESSAGE_TOKENS tokens (less when the transcript is over budget)
+COMPACT = os.getenv("COMPACT", "1") == "1"
+COMPACT_MESSAGE_TOKENS = int(os.getenv("COMPACT_MESSAGE_TOKENS", "150"))
+
+# Recorded PCM kept in memory across all speakers and sessions (decoded voice
+# is about 11.5 MB per speaker-minute); beyond it buffers spool to temp files
+# in AUDIO_SPOOL_DIR (default: the system temp directory)
+AUDIO_MEMORY_BYTES = int(os.getenv("AUDIO_MEMORY_BYTES", str(64 * 1024 * 1024)))
+AUDIO_SPOOL_DIR = os.getenv("AUDIO_SPOOL_DIR", "")
+
+# Live transcript text kept in memory before older records spill to a temp file
+TRANSCRIPT_MEMORY_BYTES = int(os.getenv("TRANSCRIPT_MEMORY_BYTES", str(1024 * 1024)))
+
+# Streamed replies edit their message at most once per this many seconds
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+
+# Local Prometheus scrape endpoint (GET /metrics); METRICS_PORT=0 turns it off
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+
+# Speculative work (opt-in): start ANALYZE and prefetch the EXPAND window while
+# the user is still reading; at most SPECULATE_MAX_TASKS run at once, results
+# are kept for SPECULATE_TTL seconds (never longer than SESSION_TTL), and
+# transcripts above SPECULATE_MAX_TOKENS are not analyzed speculatively
+SPECULATE = os.getenv("SPECULATE", "0") == "1"
+SPECULATE_MAX_TASKS = int(os.getenv("SPECULATE_MAX_TASKS", "20"))
+SPECULATE_TTL = min(int(os.getenv("SPECULATE_TTL", "900")), SESSION_TTL)
+SPECULATE_MAX_TOKENS = int(os.getenv("SPECULATE_MAX_TOKENS", "12000"))
@@ -0,0 +1,75 @@
+import collections
+import re
+import statistics
+
+# Local debate pre-check on the fetched messages. Settles the clear cases
+# (one person talking, a handful of messages, a quick back-and-forth full of
+# rebuttals) without a model call; anything in between is left to the model.
+
+_REBUTTAL = re.compile(
+    r"\b(but|actually|however|wrong|disagree|source|evidence|prove|because|that's not|thats not"
+    r"|no,|not true|false|citation|you said|you're|youre|doesn't|doesnt|isn't|isnt|so you)\b",
+    re.IGNORECASE,
+)
+# Score thresholds: at or above DEBATE it is a debate, at or below NOT_DEBATE
+# it is not, anything between goes to the model
+DEBATE = 0.7
+NOT_DEBATE = 0.2
+
+Features = collections.namedtuple(
+    "Features", "messages speakers top_two alternation replies questions rebuttals median_words"
+)
+
+def features(msgs):
+    human = [m for m in msgs if not m.bot and m.content.strip()]
+    n = len(human)
+    if not n:
+        return Features(0, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+    counts = collections.Counter(m.author_id for m in human)
+    pair = {a for a, _ in counts.most_common(2)}
+    # turn changes between the two main speakers, out of their consecutive messages
+    duo = [m.author_id for m in human if m.author_id in pair]
+    changes = sum(1 for a, b in zip(duo, duo[1:]) if a != b)
+    authors = {m.id: m.author_id for m in human}
+    replies = sum(
+        1 for m in human
+        if m.reply_to in authors and authors[m.reply_to] != m.author_id
+    )
+    return Features(
+        messages=n,
+        speakers=len(counts),
+        top_two=sum(counts[a] for a in pair) / n,
+        alternation=changes / max(1, len(duo) - 1),
+        replies=replies / n,
+        questions=sum("?" in m.content for m in human) / n,
+        rebuttals=sum(bool(_REBUTTAL.search(m.content)) for m in human) / n,
+        median_words=statistics.median(len(m.content.split()) for m in human),
+    )
+
+def score(f):
+    # 0..1; hand-weighted so each signal can only push so far on its own
+    if f.messages < 4 or f.speakers < 2:
+        return 0.0
+    s = 0.0
+    s += 0.25 * min(1.0, f.alternation / 0.6)
+    s += 0.2 * min(1.0, max(0.0, f.top_two - 0.4) / 0.4)
+    s += 0.25 * min(1.0, f.rebuttals / 0.35)
+    s += 0.1 * min(1.0, f.replies / 0.3)
+    s += 0.1 * min(1.0, f.questions / 0.2)
+    # one-word chatter is rarely an argument; paragraphs usually are
+    s += 0.1 * min(1.0, max(0.0, f.median_words - 3) / 12)
+    # no pushback at all means chatter, however lively
+    return s * (0.5 + 0.5 * min(1.0, f.rebuttals / 0.1))
+
+def classify(msgs):
+    # True (debate), False (not a debate) or None (ask the model), and the score
+    s = score(features(msgs))
+    if s >= DEBATE:
+        return True, s
+    if s <= NOT_DEBATE:
+        return False, s
+    return None, s
+
+def leans_debate(s):
+    # Best local guess when the model cannot be asked
+    return s >= (DEBATE + NOT_DEBATE) / 2
@@ -0,0 +1,163 @@
+import asyncio
+import io
+import os
+import time
+import aiohttp
+import openai
+from config import (
+    OPENAI_MODEL, WHISPER_MODEL, OPENAI_TIMEOUT, OPENAI_POOL_SIZE,
+    OPENAI_MAX_CONCURRENCY, OPENAI_GUILD_CONCURRENCY, MAX_TOKENS, CACHE_KINDS,
+)
+from cache import ResponseCache, cache_key
+from tokens import count_tokens
+import metrics
+import resilience
+
+# Single async entry point for every OpenAI call made by the handlers.
+# All requests share one pooled aiohttp session and are throttled by a global
+# semaphore plus one semaphore per guild, so a busy server cannot starve others.
+_session = None
+_global_limit = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+_guild_limits = {}
+responses = ResponseCache()
+_inflight = {}
+
+# responses.hits counts disk hits too
+metrics.collector("cache_lookups", "counter", "Response cache lookups by result.", lambda: {
+    "memory": responses.hits - responses.disk_hits, "disk": responses.disk_hits, "miss": responses.misses,
+}, label="result")
+metrics.collector("cache_hit_ratio", "gauge", "Share of response cache lookups served from cache.", lambda: (
+    responses.hits / max(1, responses.hits + responses.misses)
+))
+
+def _guild_limit(guild_id):
+    sem = _guild_limits.get(guild_id)
+    if sem is None:
+        sem = asyncio.Semaphore(OPENAI_GUILD_CONCURRENCY)
+        _guild_limits[guild_id] = sem
+    return sem
+
+def _use_session():
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=OPENAI_POOL_SIZE),
+            timeout=aiohttp.ClientTimeout(total=OPENAI_TIMEOUT),
+        )
+    # aiosession is a ContextVar, so it has to be set in the calling task
+    openai.aiosession.set(_session)
+    if not openai.api_key:
+        openai.api_key = os.getenv("OPENAI_API_KEY")
+
+async def chat(kind, system, user, guild_id=None, max_tokens=None, on_text=None):
+    # on_text, when given, is called with each piece of the reply as the model
+    # streams it; cached and shared replies arrive as one piece
+    max_tokens = max_tokens or MAX_TOKENS[kind]
+    if kind not in CACHE_KINDS:
+        return await _chat(kind, system, user, guild_id, max_tokens, on_text)
+    key = cache_key(OPENAI_MODEL, system, user, max_tokens)
+    cached = await responses.get(key)
+    if cached is not None:
+        if on_text:
+            on_text(cached)
+        return cached
+    # Identical prompts already in flight share one request
+    pending = _inflight.get(key)
+    if pending is not None:
+        text = await asyncio.shield(pending)
+        if on_text:
+            on_text(text)
+        return text
+    pending = asyncio.ensure_future(_chat(kind, system, user, guild_id, max_tokens, on_text))
+    _inflight[key] = pending
+    try:
+        text = await asyncio.shield(pending)
+    finally:
+        _inflight.pop(key, None)
+    await responses.put(key, text)
+    return text
+
+async def _chat(kind, system, user, guild_id, max_tokens, on_text=None):
+    # Retried and hedged by resilience.call; a streamed reply is only retried
+    # until its first piece has been passed on
+    streamed = []
+    feed = _collector(streamed, on_text) if on_text is not None else None
+    return await resilience.call(
+        "chat", kind, lambda: _chat_once(kind, system, user, guild_id, max_tokens, feed),
+        retry=lambda: not streamed, hedge=on_text is None,
+    )
+
+def _collector(streamed, on_text):
+    # Passes each piece on and keeps it, so a retry can tell output was shown
+    def feed(piece):
+        streamed.append(piece)
+        on_text(piece)
+    return feed
+
+async def _chat_once(kind, system, user, guild_id, max_tokens, on_text):
+    _use_session()
+    async with _guild_limit(guild_id), _global_limit:
+        start = time.perf_counter()
+        return await resilience.bounded(
+            lambda timeout: _request(kind, system, user, max_tokens, on_text, timeout, start),
+        )
+
+async def _request(kind, system, user, max_tokens, on_text, timeout, start):
+    resp = await openai.ChatCompletion.acreate(
+        model=OPENAI_MODEL,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user",   "content": user},
+        ],
+        max_tokens=max_tokens,
+        request_timeout=timeout,
+        stream=on_text is not None,
+    )
+    if on_text is None:
+        metrics.observe("openai_seconds", time.perf_counter() - start, kind=kind)
+        usage = resp.get("usage") or {}
+        metrics.inc("prompt_tokens", usage.get("prompt_tokens", 0), kind=kind)
+        metrics.inc("completion_tokens", usage.get("completion_tokens", 0), kind=kind)
+        return resp.choices[0].message.content.strip()
+    parts = []
+    async for chunk in resp:
+        piece = chunk.choices[0].get("delta", {}).get("content")
+        if piece:
+            # leading whitespace is dropped like the unstreamed reply's
+            if not parts:
+                piece = piece.lstrip()
+                if not piece:
+                    continue
+            parts.append(piece)
+            on_text(piece)
+    metrics.observe("openai_seconds", time.perf_counter() - start, kind=kind)
+    # Streamed replies carry no usage block, so count them locally
+    text = "".join(parts).strip()
+    metrics.inc("prompt_tokens", count_tokens(system) + count_tokens(user), kind=kind)
+    metrics.inc("completion_tokens", count_tokens(text), kind=kind)
+    return text
+
+async def transcribe(audio, filename="audio.wav", guild_id=None):
+    # Every attempt (retry or hedge) uploads from its own file object
+    data = audio.getvalue() if hasattr(audio, "getvalue") else bytes(audio)
+
+    async def attempt():
+        _use_session()
+        async with _guild_limit(guild_id), _global_limit:
+            start = time.perf_counter()
+            # extra keyword arguments would be posted as form fields, so the
+            # upload is bounded by bounded()'s wait alone
+            resp = await resilience.bounded(
+                lambda timeout: openai.Audio.atranscribe_raw(WHISPER_MODEL, io.BytesIO(data), filename),
+            )
+            metrics.observe("openai_seconds", time.perf_counter() - start, kind="whisper")
+        return resp
+
+    resp = await resilience.call("whisper", "whisper", attempt)
+    return resp.get("text") if isinstance(resp, dict) else getattr(resp, "text", "")
+
+async def close():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
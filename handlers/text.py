@@ -1,35 +1,119 @@
 import openai
-from ..config import sessions
-from ..prompts import SUMM_SYS, SUMM_USER, ANALYSIS_SYS, ANALYSIS_USER, ASSESS_SYS, ASSESS_USER
+from config import sessions, DEBATE_PRECHECK, SPECULATE, SPECULATE_MAX_TOKENS, COMPACT, AUDIT_DEADLINE
+from session_store import AuditSession
+import gateway
+import summarize
+import metrics
+import workers
+import resilience
+from summarize import prompt_budget
+from tokens import count_tokens
+from history import HistoryStore
+from detector import classify, leans_debate
+from speculate import speculator
+from outbound import outbox, StreamingMessage
+from prompts import SUMM_SYS, SUMM_USER, ANALYSIS_SYS, ANALYSIS_USER
 import asyncio
 
-def chunk_text(text, limit=2000):
-    if len(text) <= limit:
-        return [text]
-    chunks = []
-    while len(text) > limit:
-        split_pos = text.rfind("\n", 0, limit)
-        if split_pos == -1:
-            split_pos = limit
-        chunks.append(text[:split_pos])
-        text = text[split_pos:]
-    if text:
-        chunks.append(text)
-    return chunks
+async def send_long(channel, text):
+    # Packed into as few embed messages as possible and queued per channel
+    await outbox.send(channel, text)
 
-async def send_long(channel, text, **kwargs):
-    for chunk in chunk_text(text):
-        await channel.send(chunk, **kwargs)
+def speculate_analysis(key, transcript, guild_id):
+    # Opt-in: most users reply ANALYZE, so start it while they read the summary
+    if SPECULATE and count_tokens(transcript) <= SPECULATE_MAX_TOKENS:
+        speculator.start(key, "analysis", analyze(transcript, guild_id))
+
+async def analyze(transcript, guild_id, on_text=None):
+    with resilience.deadline(AUDIT_DEADLINE):
+        return await summarize.complete(
+            "analysis", ANALYSIS_SYS, ANALYSIS_USER, transcript, guild_id=guild_id, on_text=on_text,
+        )
+
+async def stream_analysis(channel, transcript, guild_id, key=None):
+    # The verdict fills in a placeholder message while the model writes it,
+    # or all at once if it was already computed speculatively
+    task = speculator.take(key, "analysis") if key else None
+    out = await StreamingMessage(channel, placeholder="⏳ Analyzing the debate...").start()
+    try:
+        with metrics.timer("stage_seconds", stage="analysis"):
+            if task is not None:
+                result, = await asyncio.gather(task, return_exceptions=True)
+                if isinstance(result, str):
+                    out.feed(result)
+                else:
+                    task = None  # the speculative run failed; do it for real
+            if task is None:
+                await analyze(transcript, guild_id, on_text=out.feed)
+    except Exception as e:
+        await out.finish(f"OpenAI analysis error: {e}")
+        return
+    await out.finish()
+
+# Local copy of channel history shared by all audits
+history_store = HistoryStore()
+metrics.collector("history_messages", "counter", "Messages fetched from Discord vs served from the store.",
+                  lambda: {"fetched": history_store.fetched, "served": history_store.served}, label="source")
+
+async def build_transcript(msgs):
+    turns = [(m.author_name, m.content) for m in msgs if not m.bot]
+    if not COMPACT:
+        return "\n".join(f"{name}: {content}" for name, content in turns)
+    # Aim for the analysis prompt so most audits avoid the map-reduce path
+    budget = prompt_budget("analysis") - count_tokens(ANALYSIS_SYS + ANALYSIS_USER)
+    transcript, (before, after) = await workers.compact_turns(turns, budget)
+    metrics.inc("transcript_tokens", before, stage="raw")
+    metrics.inc("transcript_tokens", after, stage="compacted")
+    return transcript
+
+async def on_raw_message_edit(payload):
+    if "content" in payload.data:
+        history_store.edit(payload.channel_id, payload.message_id, payload.data["content"])
+
+async def on_raw_message_delete(payload):
+    history_store.delete(payload.channel_id, payload.message_id)
+
+async def send_stats(message):
+    # Admin-only: the same numbers the metrics endpoint exports
+    perms = getattr(message.author, "guild_permissions", None)
+    if not perms or not perms.administrator:
+        await message.channel.send("`!stats` is only available to server administrators.")
+        return
+    await send_long(message.channel, metrics.registry.summary())
+
+def is_relevant(message, client):
+    # Cheap synchronous pre-filter run for every message before any task is made
+    if message.author.bot:
+        return False
+    content = message.content.lower()
+    if content.startswith(("!startdebate", "!enddebate", "!stats")):
+        return True
+    if client.user in message.mentions and "audit please" in content:
+        return True
+    return (message.channel.id, message.author.id) in sessions
 
 async def on_message(message, client):
-    from ..config import sessions
-    from ..prompts import SUMM_SYS, SUMM_USER, ANALYSIS_SYS, ANALYSIS_USER, ASSESS_SYS, ASSESS_USER
+    from config import sessions
+    from prompts import SUMM_SYS, SUMM_USER, ANALYSIS_SYS, ANALYSIS_USER, ASSESS_SYS, ASSESS_USER
     import os
     # Ignore messages from bots
     if message.author.bot:
         return
     content = message.content.lower().strip()
+    guild_id = message.guild.id if message.guild else None
     session_key = (message.channel.id, message.author.id)
+    # Voice debate commands
+    if content.startswith("!startdebate"):
+        from .voice import start_debate
+        await start_debate(message, client)
+        return
+    if content.startswith("!enddebate"):
+        from .voice import end_debate
+        await end_debate(message)
+        return
+    if content.startswith("!stats"):
+        await send_stats(message)
+        return
     # Step 1: Trigger audit session via reply
     if client.user in message.mentions and "audit please" in content:
         # Must be a reply to specify the debate start
@@ -41,51 +125,49 @@ async def on_message(message, client):
             return
         # Fetch the referenced message
         try:
-            start_msg = await message.channel.fetch_message(ref.message_id)
+            with metrics.timer("stage_seconds", stage="history"):
+                start_msg = await history_store.fetch(message.channel, ref.message_id)
+                # The 100 messages preceding that message (bots are dropped from the transcript)
+                msgs = await history_store.before(message.channel, start_msg.id, 100)
         except Exception:
             await message.channel.send(
                 "Could not fetch the referenced message. Please try again."
             )
             return
-        # Fetch the 100 messages preceding that message (exclude bots)
-        msgs = []
-        async for m in message.channel.history(limit=100, before=start_msg):
-            if not m.author.bot:
-                msgs.append(m)
-        msgs.reverse()
-        transcript = "\n".join(f"{m.author.display_name}: {m.content}" for m in msgs)
+        transcript = await build_transcript(msgs)
         openai.api_key = os.getenv("OPENAI_API_KEY")
         if not openai.api_key:
             await message.channel.send("ERROR: OPENAI_API_KEY not set.")
             return
-        # Preliminary check: is this actually a debate?
-        try:
-            assessment = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": ASSESS_SYS},
-                    {"role": "user",   "content": ASSESS_USER.format(transcript=transcript)},
-                ],
-                max_tokens=5,
-            )
-            answer = assessment.choices[0].message.content.strip().lower()
-        except Exception:
-            answer = "yes"
-        if answer.startswith("n"):
+        # Preliminary check: is this actually a debate? Obvious cases are
+        # settled locally, the rest by the model (with the summary if it fits)
+        debate, score = classify(msgs)
+        if not DEBATE_PRECHECK:
+            debate = None
+        metrics.inc("prechecks", result={True: "debate", False: "not_debate", None: "model"}[debate])
+        summary = None
+        if debate is None:
+            with resilience.deadline(AUDIT_DEADLINE):
+                debate, summary = await summarize.assess_and_summarize(transcript, guild_id, leans_debate(score))
+        if not debate:
             # No debate detected: prompt user for intent or broader context
             try:
                 thread = await message.create_thread(
-                    name=f"Audit Thread - {start_msg.author.display_name}",
+                    name=f"Audit Thread - {start_msg.author_name}",
                     auto_archive_duration=1440
                 )
             except Exception:
                 thread = message.channel
-            sessions[(thread.id, message.author.id)] = {
-                "state": "awaiting_confirmation",
-                "transcript": transcript,
-                "bad_count": 0,
-                "start_message_id": start_msg.id,
-            }
+            sessions[(thread.id, message.author.id)] = AuditSession(
+                "awaiting_confirmation", transcript,
+                start_message_id=start_msg.id, channel_id=message.channel.id,
+            )
+            if SPECULATE:
+                # warm the history store for an EXPAND reply; no model calls
+                speculator.start(
+                    (thread.id, message.author.id), "expand",
+                    history_store.before(message.channel, start_msg.id, 200),
+                )
             await thread.send(
                 "⚠️ I didn't detect an actual debate in those messages.\n\n"
                 "What would you like to do next?\n"
@@ -94,106 +176,87 @@ async def on_message(message, client):
                 "If it still isn't a debate after expansion, you can paste a manual transcript."
             )
             return
-        # Summarize the debate
-        try:
-            summ = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": SUMM_SYS},
-                    {"role": "user",   "content": SUMM_USER.format(transcript=transcript)},
-                ],
-                max_tokens=200,
-            )
-        except Exception as e:
-            await message.channel.send(f"OpenAI error during summary: {e}")
-            return
-        summary = summ.choices[0].message.content.strip()
         # Create a private thread for this audit
         thread = await message.create_thread(
-            name=f"Audit Thread - {start_msg.author.display_name}",
+            name=f"Audit Thread - {start_msg.author_name}",
             auto_archive_duration=1440
         )
+        if summary is not None:
+            # already written by the fused assess + summary call
+            await send_long(thread, f"**Summary:**\n{summary}")
+        else:
+            # Summarize the debate, streamed into the thread as it is written
+            out = await StreamingMessage(thread, "**Summary:**\n", "⏳ Summarizing the debate...").start()
+            try:
+                with metrics.timer("stage_seconds", stage="summary"), resilience.deadline(AUDIT_DEADLINE):
+                    summary = await summarize.complete(
+                        "summary", SUMM_SYS, SUMM_USER, transcript, guild_id=guild_id, on_text=out.feed,
+                    )
+            except Exception as e:
+                await out.finish(f"OpenAI error during summary: {e}")
+                return
+            await out.finish()
         # Store session state under the thread channel
-        sessions[(thread.id, message.author.id)] = {
-            "state": "awaiting_analysis",
-            "transcript": transcript,
-            "summary": summary,
-            "start_message_id": start_msg.id,
-        }
-        await thread.send(f"**Summary:**\n{summary}\n\nReply `ANALYZE` for full analysis or `EXPAND` for more context.")
+        sessions[(thread.id, message.author.id)] = AuditSession(
+            "awaiting_analysis", transcript, summary=summary,
+            start_message_id=start_msg.id, channel_id=message.channel.id,
+        )
+        speculate_analysis((thread.id, message.author.id), transcript, guild_id)
+        await thread.send("Reply `ANALYZE` for full analysis or `EXPAND` for more context.")
         return
     # Step 2: Handle follow-up replies in audit session threads
     if hasattr(message.channel, "id") and (message.channel.id, message.author.id) in sessions:
         session = sessions[(message.channel.id, message.author.id)]
-        state = session.get("state")
+        state = session.state
         if state == "awaiting_confirmation":
             content_upper = message.content.strip().upper()
             if content_upper == "ANALYZE":
-                manual_transcript = session.get("transcript")
+                manual_transcript = session.transcript
                 openai.api_key = os.getenv("OPENAI_API_KEY")
                 if not openai.api_key:
                     await message.channel.send("ERROR: OPENAI_API_KEY not set.")
                     sessions.pop((message.channel.id, message.author.id), None)
+                    speculator.discard(session_key)
                     return
-                try:
-                    analysis = openai.ChatCompletion.create(
-                        model="gpt-3.5-turbo",
-                        messages=[
-                            {"role": "system", "content": ANALYSIS_SYS},
-                            {"role": "user",   "content": ANALYSIS_USER.format(transcript=manual_transcript)},
-                        ],
-                        max_tokens=500,
-                    )
-                except Exception as e:
-                    await message.channel.send(f"OpenAI analysis error: {e}")
-                    sessions.pop((message.channel.id, message.author.id), None)
-                    return
-                verdict = analysis.choices[0].message.content.strip()
-                await send_long(message.channel, verdict)
+                await stream_analysis(message.channel, manual_transcript, guild_id, session_key)
                 sessions.pop((message.channel.id, message.author.id), None)
+                speculator.discard(session_key)
                 return
             elif content_upper == "EXPAND":
-                # Fetch more messages for broader context
-                start_message_id = session.get("start_message_id")
+                # Fetch more messages for broader context; the store already
+                # holds the first window, so only the older delta is downloaded
+                start_message_id = session.start_message_id
+                channel = client.get_channel(session.channel_id) or message.channel
+                prefetch = speculator.take(session_key, "expand")
                 try:
-                    start_msg = await message.channel.fetch_message(start_message_id)
+                    with metrics.timer("stage_seconds", stage="expand_history"):
+                        if prefetch is not None:
+                            # a failed prefetch just leaves the gap to fetch below
+                            await asyncio.gather(prefetch, return_exceptions=True)
+                        msgs = await history_store.before(channel, start_message_id, 200)
                 except Exception:
                     await message.channel.send("Could not fetch the referenced message for expansion.")
                     return
-                msgs = []
-                async for m in message.channel.history(limit=200, before=start_msg):
-                    if not m.author.bot:
-                        msgs.append(m)
-                msgs.reverse()
-                transcript = "\n".join(f"{m.author.display_name}: {m.content}" for m in msgs)
-                session["transcript"] = transcript
+                transcript = await build_transcript(msgs)
+                session.transcript = transcript
+                sessions[(message.channel.id, message.author.id)] = session
+                speculator.discard(session_key)
+                speculate_analysis(session_key, transcript, guild_id)
                 await message.channel.send("Context expanded. Reply `ANALYZE` to analyze or paste a manual transcript.")
                 return
         elif state == "awaiting_analysis":
             content_upper = message.content.strip().upper()
             if content_upper == "ANALYZE":
-                transcript = session.get("transcript")
+                transcript = session.transcript
                 openai.api_key = os.getenv("OPENAI_API_KEY")
                 if not openai.api_key:
                     await message.channel.send("ERROR: OPENAI_API_KEY not set.")
                     sessions.pop((message.channel.id, message.author.id), None)
+                    speculator.discard(session_key)
                     return
-                try:
-                    analysis = openai.ChatCompletion.create(
-                        model="gpt-3.5-turbo",
-                        messages=[
-                            {"role": "system", "content": ANALYSIS_SYS},
-                            {"role": "user",   "content": ANALYSIS_USER.format(transcript=transcript)},
-                        ],
-                        max_tokens=500,
-                    )
-                except Exception as e:
-                    await message.channel.send(f"OpenAI analysis error: {e}")
-                    sessions.pop((message.channel.id, message.author.id), None)
-                    return
-                verdict = analysis.choices[0].message.content.strip()
-                await send_long(message.channel, verdict)
+                await stream_analysis(message.channel, transcript, guild_id, session_key)
                 sessions.pop((message.channel.id, message.author.id), None)
+                speculator.discard(session_key)
                 return
     # No other triggers
     return
@@ -1,32 +1,195 @@
-import io
-import wave
-import openai
-from ..config import live_sessions
+from config import (
+    live_sessions, scheduler, LIVE_SEGMENT_SECONDS, LIVE_VAD, LIVE_OPUS, TRANSCRIBE_CONCURRENCY, AUDIT_DEADLINE,
+)
+from scheduler import PRIORITY_LIVE, FairLimiter
+import gateway
+import live_state
+import metrics
+import workers
+import resilience
+from voicebots import voice_bots
+from session_store import LiveSession
+from transcript import Transcript
+from outbound import StreamingMessage
+from .text import send_long
 import asyncio
+import time
+import traceback
 
-async def _recording_callback(sink, guild_id):
-    from .voice import process_audio_segment
-    await process_audio_segment(sink, guild_id)
+# Live sessions are keyed by voice channel ("room"); a server can record
+# several at once. Rooms share the worker pool and the API budget: uploads
+# take turns per room, and each room's segment jobs queue separately.
 
-async def live_recording(guild_id):
-    session = live_sessions.get(guild_id)
+# Caps concurrent Whisper uploads (and WAV conditioning) across all live sessions
+_transcription_limit = FairLimiter(TRANSCRIBE_CONCURRENCY)
+metrics.collector("transcriptions_waiting", "gauge", "Live transcriptions waiting for a slot.",
+                  lambda: _transcription_limit.waiting())
+
+async def _stream_callback(sink, room):
+    # The sink has already handed off its last utterances or segment in cleanup()
+    session = live_sessions.get(room)
+    if session and session.stream_done is not None:
+        session.stream_done.set()
+
+async def live_recording(room):
+    session = live_sessions.get(room)
     if not session:
         return
-    voice_client = session["voice_client"]
-    from discord.sinks import WaveSink
-    while session.get("recording"):
-        sink = WaveSink()
-        session["current_sink"] = sink
-        voice_client.start_recording(sink, _recording_callback, guild_id)
-        await asyncio.sleep(180)
-        voice_client.stop_recording()
-    session.pop("current_sink", None)
-
-async def process_audio_segment(sink, guild_id):
-    session = live_sessions.get(guild_id)
+    if LIVE_VAD and not LIVE_OPUS:
+        await stream_recording(room)
+        return
+    # One recording for the whole debate: the sink swaps its buffers every
+    # LIVE_SEGMENT_SECONDS without stopping the receive thread, and finished
+    # segments are queued here, so processing one can never hold up audio
+    from recording import SegmentSink, OpusSegmentSink
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    sink = (OpusSegmentSink if LIVE_OPUS else SegmentSink)(
+        lambda segment: loop.call_soon_threadsafe(queue.put_nowait, segment)
+    )
+    session.current_sink = sink
+    session.stream_done = asyncio.Event()
+    consumer = asyncio.create_task(_process_segments(queue, room))
+    session.voice_client.start_recording(sink, _stream_callback, room)
+    while session.recording:
+        try:
+            await asyncio.wait_for(session.stopped.wait(), LIVE_SEGMENT_SECONDS)
+        except asyncio.TimeoutError:
+            sink.rotate()
+    session.voice_client.stop_recording()
+    # cleanup() queues the last segment before the callback sets stream_done
+    await session.stream_done.wait()
+    queue.put_nowait(None)
+    await consumer
+    session.current_sink = None
+    session.stream_done = None
+
+async def _process_segments(queue, room):
+    # One at a time and in order: each segment's notes build on the last
+    while (segment := await queue.get()) is not None:
+        try:
+            await scheduler.run(room, PRIORITY_LIVE, process_audio_segment, segment, room)
+        except Exception:
+            traceback.print_exc()
+
+async def stream_recording(room):
+    # One long-lived recording; the VAD sink queues each utterance as soon as the
+    # speaker pauses, so transcription runs while the debate is still going and
+    # the periodic live summary only has to wait for the model.
+    session = live_sessions.get(room)
+    if not session:
+        return
+    from recording import UtteranceSink
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    sink = UtteranceSink(lambda *u: loop.call_soon_threadsafe(queue.put_nowait, u))
+    session.current_sink = sink
+    session.stream_done = asyncio.Event()
+    pending = []
+    tasks = set()
+    session.voice_client.start_recording(sink, _stream_callback, room)
+    next_summary = loop.time() + LIVE_SEGMENT_SECONDS
+    while session.recording:
+        try:
+            utterance = await asyncio.wait_for(queue.get(), 0.25)
+        except asyncio.TimeoutError:
+            utterance = None
+        if utterance:
+            task = asyncio.create_task(_transcribe_utterance(session, utterance, pending))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        sink.poll()
+        if loop.time() >= next_summary:
+            next_summary = loop.time() + LIVE_SEGMENT_SECONDS
+            entries = sorted(pending)
+            pending.clear()
+            task = asyncio.create_task(
+                scheduler.run(room, PRIORITY_LIVE, _post_segment, session, entries)
+            )
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    session.voice_client.stop_recording()
+    await session.stream_done.wait()
+    while not queue.empty():
+        utterance = queue.get_nowait()
+        tasks.add(asyncio.create_task(_transcribe_utterance(session, utterance, pending)))
+    if tasks:
+        await asyncio.gather(*tasks)
+    await _post_segment(session, sorted(pending))
+    session.current_sink = None
+    session.stream_done = None
+
+async def _transcribe_utterance(session, utterance, pending):
+    user_id, pcm, start, end = utterance
+    try:
+        async with _transcription_limit.slot(session.room):
+            with metrics.timer("stage_seconds", stage="condition_audio"):
+                buffer = await workers.condition_audio(pcm)
+            pcm.close()
+            _count_upload(buffer)
+            with metrics.timer("stage_seconds", stage="transcribe"), resilience.deadline(LIVE_SEGMENT_SECONDS):
+                text = await gateway.transcribe(buffer, "utterance.wav", guild_id=session.guild_id)
+    except Exception as e:
+        await session.thread.send(f"Error during transcription for <@{user_id}>: {e}")
+        return
+    finally:
+        pcm.close()
+    if text and text.strip():
+        pending.append((start, end, user_id, _speaker_name(session, user_id), text.strip()))
+
+def _count_upload(buffer):
+    # Once per utterance or segment, however many upload attempts it takes
+    metrics.observe("audio_upload_bytes", buffer.getbuffer().nbytes)
+
+def _speaker_name(session, user_id):
+    # Looked up through the main bot: a voice-only account has no member cache
+    member = session.thread.guild.get_member(user_id)
+    return member.display_name if member else str(user_id)
+
+async def _post_segment(session, entries):
+    # entries: (start_ts, end_ts, speaker_id, name, text) in speaking order
+    if not entries:
+        return
+    thread = session.thread
+    for start, end, user_id, name, text in entries:
+        session.full_transcript.append(user_id, name, start, end, text)
+    segment = session.full_transcript.end_segment()
+    if not session.recording:
+        # Debate is ending: the final verdict reads this segment verbatim
+        session.unfolded.append(segment)
+        return
+    # Fold the segment into the rolling notes, along with any earlier ones whose
+    # update failed; one call also yields the live summary
+    async with session.state_lock:
+        transcript, folded = session.full_transcript.tail(
+            live_state.update_budget(session.state), session.unfolded + [segment],
+        )
+        try:
+            with metrics.timer("stage_seconds", stage="live_update"), resilience.deadline(LIVE_SEGMENT_SECONDS):
+                summary, session.state = await live_state.update(
+                    session.state, transcript, guild_id=session.guild_id,
+                )
+        except Exception as e:
+            # keep the segment for the next update since it never reached the notes
+            session.unfolded.append(segment)
+            await thread.send(f"Error during summary: {e}")
+            return
+        dropped = [s for s in session.unfolded if s not in folded]
+        session.unfolded.clear()
+    if dropped:
+        await thread.send(f"Too much speech to catch up on: {_segment_names(dropped)} left out of the notes.")
+    await send_long(thread, f"**Live summary (last {LIVE_SEGMENT_SECONDS // 60} minutes):**\n{summary}")
+    metrics.observe("live_segment_seconds", time.time() - max(end for _, end, *_ in entries), room=str(session.room))
+
+def _segment_names(segments):
+    numbers = ", ".join(str(s + 1) for s in segments)
+    return f"segment {numbers} was" if len(segments) == 1 else f"segments {numbers} were"
+
+async def process_audio_segment(sink, room):
+    session = live_sessions.get(room)
     if not session:
         return
-    thread = session["thread"]
+    thread = session.thread
     if hasattr(sink, "buffers"):
         chunks = sink.buffers
     elif hasattr(sink, "audio_data"):
@@ -34,41 +197,131 @@ async def process_audio_segment(sink, guild_id):
     else:
         await thread.send("Unsupported sink; cannot process audio.")
         return
-    transcripts = []
-    for user_id, frames in chunks.items():
-        if not frames:
-            continue
-        buffer = io.BytesIO()
-        wf = wave.open(buffer, "wb")
-        wf.setnchannels(1)
-        wf.setsampwidth(2)
-        wf.setframerate(48000)
-        wf.writeframes(b"".join(frames))
-        wf.close()
-        buffer.seek(0)
-        try:
-            resp = openai.Audio.transcribe("whisper-1", buffer)
-            text = resp.get("text") if isinstance(resp, dict) else getattr(resp, "text", "")
-        except Exception as e:
-            await thread.send(f"Error during transcription for <@{user_id}>: {e}")
-            continue
-        member = session["voice_client"].guild.get_member(user_id)
-        name = member.display_name if member else str(user_id)
-        transcripts.append(f"{name}: {text}")
-    if not transcripts:
+    # Transcribe all speakers concurrently; gather keeps the sink's speaker order.
+    # Without per-utterance timing every speaker spans the whole window.
+    end = getattr(sink, "end", None) or time.time()
+    start = getattr(sink, "start", None) or end - LIVE_SEGMENT_SECONDS
+    results = await asyncio.gather(*(
+        _transcribe_speaker(session, user_id, frames)
+        for user_id, frames in chunks.items() if frames
+    ))
+    entries = [(start, end) + r for r in results if r]
+    await _post_segment(session, entries)
+
+async def _transcribe_speaker(session, user_id, frames):
+    # Recorded PCM is released as soon as it is conditioned; only the much
+    # smaller WAV waits for the upload
+    release = getattr(frames, "close", None) if hasattr(frames, "view") else None
+    try:
+        async with _transcription_limit.slot(session.room):
+            if getattr(frames, "encoding", None) == "ogg":
+                # Opus passthrough: already compact, uploaded as recorded
+                buffer, filename = frames.upload(), "segment.ogg"
+            else:
+                with metrics.timer("stage_seconds", stage="condition_audio"):
+                    buffer = await workers.condition_audio(frames)
+                filename = "segment.wav"
+            _count_upload(buffer)
+            if release:
+                release()
+            # a segment's work has until the next segment is ready
+            with metrics.timer("stage_seconds", stage="transcribe"), resilience.deadline(LIVE_SEGMENT_SECONDS):
+                text = await gateway.transcribe(buffer, filename, guild_id=session.guild_id)
+    except Exception as e:
+        await session.thread.send(f"Error during transcription for <@{user_id}>: {e}")
+        return None
+    finally:
+        if release:
+            release()
+    return (user_id, _speaker_name(session, user_id), text)
+
+async def start_debate(message, client):
+    guild = message.guild
+    if guild is None:
+        return
+    voice = getattr(message.author, "voice", None)
+    if not voice or not voice.channel:
+        await message.channel.send("Join a voice channel first, then use `!startdebate`.")
+        return
+    if voice.channel.id in live_sessions:
+        await message.channel.send("A live debate is already being recorded in this voice channel. Use `!enddebate` first.")
         return
-    session["full_transcript"] += "\n".join(transcripts) + "\n"
     try:
-        summ = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an impartial debate referee summarizing a live segment of a debate. Provide a concise summary of the main points made in the following transcript."},
-                {"role": "user", "content": "Transcript:\n" + "\n".join(transcripts)},
-            ],
-            max_tokens=150,
-        )
-        summary = summ.choices[0].message.content.strip()
+        if LIVE_OPUS:
+            from passthrough import PassthroughVoiceClient
+            voice_client = await voice_bots.connect(client, voice.channel, cls=PassthroughVoiceClient)
+        else:
+            voice_client = await voice_bots.connect(client, voice.channel)
     except Exception as e:
-        await thread.send(f"Error during summary: {e}")
+        await message.channel.send(f"Could not join your voice channel: {e}")
         return
-    await thread.send(f"**Live summary (last 3 minutes):**\n{summary}")
+    if voice_client is None:
+        await message.channel.send(
+            "Every voice bot is already recording a room in this server. "
+            "End one of those debates first, or add more `VOICE_BOT_TOKENS`."
+        )
+        return
+    try:
+        thread = await message.create_thread(
+            name=f"DEBATE LIVE NOTES - {voice.channel.name}", auto_archive_duration=1440,
+        )
+    except Exception:
+        thread = message.channel
+    session = LiveSession(
+        voice_client, thread, live_state.empty_state(), asyncio.Lock(), asyncio.Event(), Transcript(),
+    )
+    live_sessions[session.room] = session
+    session.task = asyncio.create_task(live_recording(session.room))
+    await thread.send(
+        f"🎙️ Recording **{voice.channel.name}**. Live summaries will be posted here every "
+        f"{LIVE_SEGMENT_SECONDS // 60} minutes; use `!enddebate` to finish and get the full analysis."
+    )
+
+def _find_session(message):
+    # The room whose notes thread this is, else the room the author is in,
+    # else the server's only room
+    rooms = [s for s in live_sessions.values() if s.guild_id == message.guild.id]
+    for session in rooms:
+        if session.thread.id == message.channel.id:
+            return session, rooms
+    voice = getattr(message.author, "voice", None)
+    if voice and voice.channel and voice.channel.id in live_sessions:
+        return live_sessions.get(voice.channel.id), rooms
+    return (rooms[0] if len(rooms) == 1 else None), rooms
+
+async def end_debate(message):
+    guild = message.guild
+    session, rooms = _find_session(message) if guild else (None, [])
+    if not session:
+        if rooms:
+            await message.channel.send(
+                f"{len(rooms)} live debates are being recorded in this server. "
+                "Use `!enddebate` in the debate's notes thread or while in its voice channel."
+            )
+        else:
+            await message.channel.send("No live debate is being recorded in this server.")
+        return
+    thread = session.thread
+    session.recording = False
+    session.stopped.set()
+    out = await StreamingMessage(thread, placeholder="⏹️ Recording stopped. Preparing the full debate analysis...").start()
+    try:
+        await session.task
+        if not session.full_transcript:
+            await out.finish("No speech was transcribed during this debate.")
+            return
+        with metrics.timer("stage_seconds", stage="final_verdict"), resilience.deadline(AUDIT_DEADLINE):
+            _, dropped = await live_state.final_verdict(
+                session.state, session.full_transcript, session.unfolded,
+                guild_id=session.guild_id, on_text=out.feed,
+            )
+    except Exception as e:
+        await out.finish(f"OpenAI analysis error: {e}")
+    else:
+        await out.finish()
+        if dropped:
+            await thread.send(f"Too much speech to fit: {_segment_names(dropped)} left out of the verdict.")
+    finally:
+        live_sessions.pop(session.room, None)
+        session.full_transcript.close()
+        await session.voice_client.disconnect()
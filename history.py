@@ -0,0 +1,249 @@
+import asyncio
+import bisect
+import collections
+import sqlite3
+import threading
+import discord
+from config import HISTORY_MAX_MESSAGES, HISTORY_MAX_CHANNELS, HISTORY_PATH
+
+StoredMessage = collections.namedtuple(
+    "StoredMessage", "id author_id author_name bot content reply_to", defaults=(None,)
+)
+
+def stored(message):
+    ref = message.reference
+    return StoredMessage(
+        message.id, message.author.id, message.author.display_name, message.author.bot, message.content,
+        ref.message_id if ref else None,
+    )
+
+class _Channel:
+    __slots__ = ("ids", "messages", "ranges", "live_lo")
+
+    def __init__(self):
+        self.ids = []  # sorted snowflakes
+        self.messages = {}
+        # sorted, disjoint [lo, hi] snowflake ranges known to be complete;
+        # lo == 0 means nothing older exists
+        self.ranges = []
+        self.live_lo = None  # first message seen through on_message since connect
+
+    def add(self, msg):
+        if msg.id not in self.messages:
+            if not self.ids or msg.id > self.ids[-1]:
+                self.ids.append(msg.id)
+            else:
+                bisect.insort(self.ids, msg.id)
+        self.messages[msg.id] = msg
+
+    def remove(self, message_id):
+        if self.messages.pop(message_id, None) is not None:
+            del self.ids[bisect.bisect_left(self.ids, message_id)]
+
+    def cover(self, lo, hi):
+        merged = []
+        for r in sorted(self.ranges + [[lo, hi]]):
+            if merged and r[0] <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], r[1])
+            else:
+                merged.append(list(r))
+        self.ranges = merged
+
+    def range_at(self, message_id):
+        i = bisect.bisect_right(self.ranges, [message_id, float("inf")]) - 1
+        if i >= 0 and self.ranges[i][1] >= message_id:
+            return self.ranges[i]
+        return None
+
+    def range_below(self, message_id):
+        # upper bound of the nearest complete range entirely below message_id
+        i = bisect.bisect_left(self.ranges, [message_id, -1]) - 1
+        return self.ranges[i][1] if i >= 0 else None
+
+    def trim(self, limit):
+        if len(self.ids) <= limit:
+            return
+        for message_id in self.ids[:len(self.ids) - limit]:
+            del self.messages[message_id]
+        del self.ids[:len(self.ids) - limit]
+        oldest = self.ids[0]
+        self.ranges = [[max(lo, oldest), hi] for lo, hi in self.ranges if hi >= oldest]
+
+class HistoryStore:
+    # Per-channel message store keyed by snowflake. It is fed by on_message and
+    # by history fetches, remembers which id ranges are complete, and only asks
+    # Discord for the ranges it is missing.
+    def __init__(self, max_messages=HISTORY_MAX_MESSAGES, max_channels=HISTORY_MAX_CHANNELS, path=HISTORY_PATH):
+        self.max_messages = max_messages
+        self.max_channels = max_channels
+        self.channels = collections.OrderedDict()
+        self.fetched = 0
+        self.served = 0
+        self.db = None
+        self.lock = threading.Lock()
+        self.dirty = {}  # channel_id -> {message_id: StoredMessage or None}
+        self.dirty_count = 0
+        self.flushes = set()  # background flushes, kept so they are not collected mid-run
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS messages (channel_id INTEGER, id INTEGER PRIMARY KEY,"
+                " author_id INTEGER, author_name TEXT, bot INTEGER, content TEXT, reply_to INTEGER)"
+            )
+            try:
+                self.db.execute("ALTER TABLE messages ADD COLUMN reply_to INTEGER")
+            except sqlite3.OperationalError:
+                pass  # already there
+            self.db.execute("CREATE INDEX IF NOT EXISTS messages_channel ON messages (channel_id, id)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS ranges (channel_id INTEGER, lo INTEGER, hi INTEGER)")
+
+    def _channel(self, channel_id):
+        ch = self.channels.get(channel_id)
+        if ch is None:
+            ch = self.channels[channel_id] = self._load(channel_id)
+            while len(self.channels) > self.max_channels:
+                self.channels.popitem(last=False)
+        else:
+            self.channels.move_to_end(channel_id)
+        return ch
+
+    def record(self, message):
+        ch = self._channel(message.channel.id)
+        msg = stored(message)
+        ch.add(msg)
+        self._mark(message.channel.id, msg.id, msg)
+        if ch.live_lo is None:
+            ch.live_lo = msg.id
+        ch.cover(ch.live_lo, msg.id)
+        ch.trim(self.max_messages)
+
+    def edit(self, channel_id, message_id, content):
+        ch = self.channels.get(channel_id)
+        msg = ch.messages.get(message_id) if ch else None
+        if msg is not None:
+            msg = msg._replace(content=content)
+            ch.messages[message_id] = msg
+            self._mark(channel_id, message_id, msg)
+
+    def delete(self, channel_id, message_id):
+        ch = self.channels.get(channel_id)
+        if ch is not None:
+            ch.remove(message_id)
+            self._mark(channel_id, message_id, None)
+
+    def reset_live(self):
+        # After a fresh gateway session events may have been missed
+        for ch in self.channels.values():
+            ch.live_lo = None
+
+    async def fetch(self, channel, message_id):
+        ch = self._channel(channel.id)
+        msg = ch.messages.get(message_id)
+        if msg is None:
+            msg = stored(await channel.fetch_message(message_id))
+            ch.add(msg)
+            self._mark(channel.id, msg.id, msg)
+        return msg
+
+    async def before(self, channel, anchor_id, limit):
+        # The `limit` messages preceding anchor_id, oldest first; same window as
+        # channel.history(limit=limit, before=anchor)
+        ch = self._channel(channel.id)
+        # messages, not ids: a record() while a gap is fetched may trim the
+        # ones already found out of the channel
+        found = []
+        cursor = anchor_id - 1
+        while len(found) < limit:
+            rng = ch.range_at(cursor)
+            if rng is None:
+                # fetch only the gap down to the next complete range we hold
+                want = limit - len(found)
+                floor = ch.range_below(cursor)
+                batch = []
+                async for m in channel.history(
+                    limit=want,
+                    before=discord.Object(id=cursor + 1),
+                    after=discord.Object(id=floor) if floor else None,
+                    oldest_first=False,
+                ):
+                    batch.append(stored(m))
+                for msg in batch:
+                    ch.add(msg)
+                    self._mark(channel.id, msg.id, msg)
+                self.fetched += len(batch)
+                if len(batch) < want:
+                    ch.cover(floor + 1 if floor else 0, cursor)
+                else:
+                    ch.cover(batch[-1].id, cursor)
+                continue
+            end = bisect.bisect_right(ch.ids, cursor)
+            start = max(bisect.bisect_left(ch.ids, rng[0]), end - (limit - len(found)))
+            found.extend(ch.messages[message_id] for message_id in reversed(ch.ids[start:end]))
+            if rng[0] == 0:
+                break
+            cursor = rng[0] - 1
+        result = found[::-1]
+        self.served += len(result)
+        ch.trim(self.max_messages)
+        await self.flush()
+        return result
+
+    async def flush(self):
+        if self.db is None or not self.dirty:
+            return
+        dirty, self.dirty, self.dirty_count = self.dirty, {}, 0
+        ranges = {channel_id: [list(r) for r in self.channels[channel_id].ranges]
+                  for channel_id in dirty if channel_id in self.channels}
+        await asyncio.to_thread(self._flush, dirty, ranges)
+
+    def _mark(self, channel_id, message_id, msg):
+        if self.db is None:
+            return
+        self.dirty.setdefault(channel_id, {})[message_id] = msg
+        self.dirty_count += 1
+        if self.dirty_count == 500:
+            task = asyncio.get_running_loop().create_task(self.flush())
+            self.flushes.add(task)
+            task.add_done_callback(self.flushes.discard)
+
+    def _load(self, channel_id):
+        ch = _Channel()
+        if self.db is None:
+            return ch
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT id, author_id, author_name, bot, content, reply_to FROM messages"
+                " WHERE channel_id = ? ORDER BY id DESC LIMIT ?", (channel_id, self.max_messages)
+            ).fetchall()
+            ranges = self.db.execute(
+                "SELECT lo, hi FROM ranges WHERE channel_id = ? ORDER BY lo", (channel_id,)
+            ).fetchall()
+        for row in reversed(rows):
+            ch.add(StoredMessage(row[0], row[1], row[2], bool(row[3]), row[4], row[5]))
+        for lo, hi in ranges:
+            ch.cover(lo, hi)
+        if len(rows) == self.max_messages:
+            # older rows stay on disk only, so memory coverage starts here
+            oldest = ch.ids[0]
+            ch.ranges = [[max(lo, oldest), hi] for lo, hi in ch.ranges if hi >= oldest]
+        return ch
+
+    def _flush(self, dirty, ranges):
+        with self.lock:
+            for channel_id, messages in dirty.items():
+                for message_id, msg in messages.items():
+                    if msg is None:
+                        self.db.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+                    else:
+                        self.db.execute(
+                            "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (channel_id, msg.id, msg.author_id, msg.author_name, int(msg.bot), msg.content,
+                             msg.reply_to),
+                        )
+                if channel_id in ranges:
+                    self.db.execute("DELETE FROM ranges WHERE channel_id = ?", (channel_id,))
+                    self.db.executemany(
+                        "INSERT INTO ranges VALUES (?, ?, ?)",
+                        [(channel_id, lo, hi) for lo, hi in ranges[channel_id]],
+                    )
+            self.db.commit()
@@ -0,0 +1,67 @@
+import json
+import gateway
+import summarize
+from prompts import ANALYSIS_SYS, ANALYSIS_USER, LIVE_STATE_SYS, LIVE_STATE_USER, LIVE_FINAL_USER
+from tokens import count_tokens
+
+# Rolling notes for a live debate, updated once per segment so that the final
+# verdict only has to read these notes plus the last few minutes of speech.
+
+def empty_state():
+    return {"summary": "", "claims": {}, "contested": [], "unanswered": []}
+
+def is_empty(state):
+    return not any(state.values())
+
+def render(state):
+    return json.dumps(state, ensure_ascii=False, indent=1)
+
+def _parse(reply):
+    start, end = reply.find("{"), reply.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("live notes reply was not JSON")
+    data = json.loads(reply[start:end + 1])
+    if not isinstance(data, dict):
+        raise ValueError("live notes reply was not a JSON object")
+    return data
+
+def update_budget(state):
+    # Tokens left for segment transcript in an update against these notes
+    return (summarize.prompt_budget("live_state") - count_tokens(LIVE_STATE_SYS)
+            - count_tokens(LIVE_STATE_USER.format(state=render(state), transcript="")))
+
+async def update(state, transcript, guild_id=None):
+    # One call returns both the segment summary for the notes thread and the
+    # new rolling state; raises if the reply cannot be parsed
+    reply = await gateway.chat(
+        "live_state", LIVE_STATE_SYS,
+        LIVE_STATE_USER.format(state=render(state), transcript=transcript),
+        guild_id=guild_id,
+    )
+    data = _parse(reply)
+    new_state = empty_state()
+    for key, default in new_state.items():
+        value = data.get(key, state.get(key, default))
+        if isinstance(value, type(default)):
+            new_state[key] = value
+    return str(data.get("segment_summary", "")).strip(), new_state
+
+async def final_verdict(state, full_transcript, segments, guild_id=None, on_text=None):
+    # segments: the transcript segments that never made it into the notes.
+    # Returns the verdict and those segments that did not fit in the prompt.
+    if is_empty(state):
+        # nothing was folded into the notes (short debate): analyze the transcript
+        reply = await summarize.complete(
+            "analysis", ANALYSIS_SYS, ANALYSIS_USER, full_transcript.render(),
+            guild_id=guild_id, on_text=on_text,
+        )
+        return reply, []
+    notes = render(state)
+    budget = (summarize.prompt_budget("analysis") - count_tokens(ANALYSIS_SYS)
+              - count_tokens(LIVE_FINAL_USER.format(state=notes, transcript="")))
+    transcript, kept = full_transcript.tail(budget, segments)
+    reply = await gateway.chat(
+        "analysis", ANALYSIS_SYS, LIVE_FINAL_USER.format(state=notes, transcript=transcript),
+        guild_id=guild_id, on_text=on_text,
+    )
+    return reply, [s for s in segments if s not in kept]
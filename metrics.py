@@ -0,0 +1,187 @@
+import bisect
+import time
+from contextlib import contextmanager
+
+# Process-wide metrics: latency histograms and counters recorded by the
+# handlers, plus collectors that read the counters other modules already keep
+# (cache, scheduler, history, outbox) when a snapshot is taken. Exposed in the
+# Prometheus text format by serve() and summarized by the !stats command.
+PREFIX = "debateauditor_"
+SECONDS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120)
+BYTES = (16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 25e6)
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = self.buckets[i - 1] if i else 0.0
+                hi = self.buckets[i] if i < len(self.buckets) else lo
+                return lo + (hi - lo) * (rank - seen) / n
+            seen += n
+        return self.buckets[-1]
+
+class Registry:
+    def __init__(self):
+        self.histograms = {}  # name -> {labels: Histogram}
+        self.counters = {}    # name -> {labels: value}
+        self.collectors = {}  # name -> (kind, label, fn)
+        self.help = {}
+        self.buckets = {}
+
+    def histogram(self, name, help, buckets=SECONDS):
+        self.help[name] = help
+        self.buckets[name] = buckets
+        self.histograms.setdefault(name, {})
+
+    def counter(self, name, help):
+        self.help[name] = help
+        self.counters.setdefault(name, {})
+
+    def collector(self, name, kind, help, fn, label=None):
+        # fn returns a number, or {label value: number} when label is given
+        # registering a name again replaces the earlier collector
+        self.help[name] = help
+        self.collectors[name] = (kind, label, fn)
+
+    def observe(self, name, value, **labels):
+        series = self.histograms[name]
+        key = tuple(sorted(labels.items()))
+        hist = series.get(key)
+        if hist is None:
+            hist = series[key] = Histogram(self.buckets[name])
+        hist.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        series = self.counters[name]
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def _collected(self):
+        for name, (kind, label, fn) in self.collectors.items():
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if label is None:
+                yield name, kind, {(): value}
+            else:
+                yield name, kind, {((label, k),): v for k, v in value.items()}
+
+    def render(self):
+        lines = []
+        for name, series in self.histograms.items():
+            lines += [f"# HELP {PREFIX}{name} {self.help[name]}", f"# TYPE {PREFIX}{name} histogram"]
+            for key, hist in series.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets[name] + (float("inf"),), hist.counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{PREFIX}{name}_bucket{_labels(key + (('le', le),))} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{_labels(key)} {hist.sum:.6f}")
+                lines.append(f"{PREFIX}{name}_count{_labels(key)} {hist.count}")
+        for name, series in self.counters.items():
+            lines += [f"# HELP {PREFIX}{name} {self.help[name]}", f"# TYPE {PREFIX}{name} counter"]
+            lines += [f"{PREFIX}{name}{_labels(key)} {value:g}" for key, value in series.items()]
+        for name, kind, series in self._collected():
+            lines += [f"# HELP {PREFIX}{name} {self.help[name]}", f"# TYPE {PREFIX}{name} {kind}"]
+            lines += [f"{PREFIX}{name}{_labels(key)} {value:g}" for key, value in series.items()]
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        # Short human-readable report for !stats
+        lines = ["**Latency (p50 / p95 / p99, count)**"]
+        for name, series in self.histograms.items():
+            if name == "audio_upload_bytes":
+                continue
+            for key, hist in sorted(series.items()):
+                if hist.count:
+                    label = "/".join((name.rsplit("_", 1)[0],) + tuple(v for _, v in key))
+                    lines.append(
+                        f"`{label}`: {hist.quantile(0.5):.2f}s / {hist.quantile(0.95):.2f}s / "
+                        f"{hist.quantile(0.99):.2f}s ({hist.count})"
+                    )
+        lines.append("**Tokens (prompt / completion)**")
+        prompt, completion = self.counters["prompt_tokens"], self.counters["completion_tokens"]
+        for key in sorted(prompt):
+            lines.append(f"`{key[0][1]}`: {prompt[key]:g} / {completion.get(key, 0):g}")
+        for name, series in self.counters.items():
+            if series and name not in ("prompt_tokens", "completion_tokens"):
+                lines.append(f"**{name}:** " + ", ".join(
+                    "/".join(v for _, v in key) + f"={value:g}" for key, value in sorted(series.items())
+                ))
+        audio = self.histograms["audio_upload_bytes"]
+        for hist in audio.values():
+            if hist.count:
+                lines.append(f"**Audio uploaded:** {hist.sum / 1e6:.1f} MB in {hist.count} uploads")
+        lines.append("**Current**")
+        for name, _, series in self._collected():
+            lines.append(f"`{name}`: " + ", ".join(
+                f"{key[0][1]}={value:g}" if key else f"{value:g}" for key, value in series.items()
+            ))
+        return "\n".join(lines)
+
+def _labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in key) + "}"
+
+registry = Registry()
+registry.histogram("stage_seconds", "Wall time of each audit and live-debate stage.")
+registry.histogram("openai_seconds", "OpenAI request latency by prompt kind.")
+registry.histogram("discord_seconds", "Discord send and edit latency.")
+registry.histogram("audio_upload_bytes", "Audio bytes uploaded per transcription.", BYTES)
+registry.histogram("live_segment_seconds", "Time from the end of a live segment to its notes being posted, per room.")
+registry.counter("prechecks", "Debate pre-check outcomes (model = left to the model, fallback = model unreachable).")
+registry.counter("speculations", "Speculative work by kind and outcome (started/used/wasted/skipped).")
+registry.counter("transcript_tokens", "Transcript tokens before and after compaction.")
+registry.counter("prompt_tokens", "Prompt tokens sent by prompt kind.")
+registry.counter("completion_tokens", "Completion tokens received by prompt kind.")
+registry.counter("openai_errors", "Failed OpenAI attempts by endpoint and reason.")
+registry.counter("openai_retries", "OpenAI attempts repeated after a retryable failure.")
+registry.counter("hedges", "Hedged requests sent, and whether the hedge or the original won.")
+registry.counter("circuit_trips", "Times an endpoint's circuit breaker opened.")
+
+timer = registry.timer
+observe = registry.observe
+inc = registry.inc
+collector = registry.collector
+
+async def serve(host, port):
+    # Local scrape endpoint: GET /metrics
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,182 @@
+import asyncio
+import discord
+from config import STREAM_EDIT_INTERVAL
+import metrics
+
+MESSAGE_LIMIT = 2000
+EMBED_LIMIT = 4096
+EMBEDS_PER_MESSAGE = 10
+EMBED_TOTAL_LIMIT = 6000
+_FENCE_CLOSE = "```"
+# shown after streamed text while the model is still writing
+_CURSOR = " ▌"
+
+def _is_fence(line):
+    return line.lstrip().startswith("```")
+
+def _emit(chunks, lines):
+    # A chunk holding nothing but fence lines would post as an empty code block
+    if any(_is_fence(line) for line in lines) and all(_is_fence(line) or not line.strip() for line in lines):
+        return
+    chunks.append("\n".join(lines))
+
+def chunk_text(text, limit=MESSAGE_LIMIT):
+    # One pass over the lines. Splits only between lines, except for lines that
+    # are longer than the limit on their own. A code block cut in two is closed
+    # at the end of one chunk and reopened at the start of the next; room for
+    # the closing fence is kept from the line that opens the block, so no
+    # chunk ever exceeds the limit.
+    chunks, current, size = [], [], 0
+    fence = None  # opening fence line while inside a code block
+    for line in text.split("\n"):
+        opens = fence is None and _is_fence(line)
+        closes = fence is not None and _is_fence(line)
+        reserve = len(_FENCE_CLOSE) + 1 if opens or (fence and not closes) else 0
+        step = limit - reserve - (len(fence) + 1 if fence else 0)
+        pieces = [line[i:i + step] for i in range(0, len(line), step)] if len(line) > step else [line]
+        for piece in pieces:
+            if current and size + len(piece) + reserve > limit:
+                if fence and current[-1] == fence:
+                    # the block opened on the chunk's last line: move it whole
+                    current.pop()
+                    _emit(chunks, current)
+                else:
+                    _emit(chunks, current + [_FENCE_CLOSE] if fence else current)
+                current = [fence] if fence else []
+                size = len(fence) + 1 if fence else 0
+            current.append(piece)
+            size += len(piece) + 1
+        if opens:
+            fence = line.strip()
+        elif closes:
+            fence = None
+    if current:
+        _emit(chunks, current)
+    return chunks
+
+def pack_embeds(text):
+    # Lists of embeds, each list small enough for a single message
+    messages, batch, total = [], [], 0
+    for chunk in chunk_text(text, EMBED_LIMIT):
+        if batch and (len(batch) == EMBEDS_PER_MESSAGE or total + len(chunk) > EMBED_TOTAL_LIMIT):
+            messages.append(batch)
+            batch, total = [], 0
+        batch.append(discord.Embed(description=chunk))
+        total += len(chunk)
+    if batch:
+        messages.append(batch)
+    return messages
+
+class Outbox:
+    # One sender per channel so sends to the same channel never race each
+    # other into its rate-limit bucket; different channels and threads send in
+    # parallel. Texts queued while a send is in progress are coalesced into
+    # the next packed send. discord.py still enforces the buckets themselves.
+    def __init__(self):
+        self.queues = {}
+        self.workers = {}
+        self.messages_sent = 0
+
+    async def send(self, channel, text):
+        future = asyncio.get_running_loop().create_future()
+        queue = self.queues.setdefault(channel.id, [])
+        queue.append((text, future))
+        if channel.id not in self.workers:
+            self.workers[channel.id] = asyncio.create_task(self._drain(channel))
+        return await future
+
+    async def _drain(self, channel):
+        try:
+            while self.queues.get(channel.id):
+                batch = self.queues.pop(channel.id)
+                try:
+                    for embeds in pack_embeds("\n\n".join(text for text, _ in batch)):
+                        with metrics.timer("discord_seconds", op="send"):
+                            await channel.send(embeds=embeds)
+                        self.messages_sent += 1
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_result(None)
+        finally:
+            self.workers.pop(channel.id, None)
+
+class StreamingMessage:
+    # A reply that fills in while the model is still writing it. A placeholder
+    # is posted up front; streamed text is collected by feed() and a background
+    # task edits the message at most once per interval. When the text outgrows
+    # one embed, the full part is left in place and a new message carries on.
+    def __init__(self, channel, prefix="", placeholder="⏳ Working on it...", interval=STREAM_EDIT_INTERVAL):
+        self.channel = channel
+        self.placeholder = placeholder
+        self.interval = interval
+        self.text = prefix
+        self.sent = 0  # characters already settled in earlier messages
+        self.message = None
+        self.edits = 0
+        self._dirty = asyncio.Event()
+        self._task = None
+
+    async def start(self):
+        await self._post()
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def feed(self, piece):
+        self.text += piece
+        self._dirty.set()
+
+    async def _run(self):
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            try:
+                await self._flush()
+            except discord.HTTPException:
+                pass  # the next edit (or finish) carries the same text
+            await asyncio.sleep(self.interval)
+
+    async def _flush(self, final=False):
+        # Roll over at a line break so a settled message never has to change
+        while len(self.text) - self.sent > EMBED_LIMIT:
+            cut = self.text.rfind("\n", self.sent, self.sent + EMBED_LIMIT)
+            if cut <= self.sent:
+                cut = self.sent + EMBED_LIMIT
+            await self._edit(self.text[self.sent:cut])
+            self.sent = cut + (self.text[cut:cut + 1] == "\n")
+            await self._post()
+        part = self.text[self.sent:]
+        if not final and len(part) + len(_CURSOR) <= EMBED_LIMIT:
+            part += _CURSOR
+        await self._edit(part or self.placeholder)
+
+    async def _post(self):
+        with metrics.timer("discord_seconds", op="send"):
+            self.message = await self.channel.send(embed=discord.Embed(description=self.placeholder))
+
+    async def _edit(self, text):
+        with metrics.timer("discord_seconds", op="edit"):
+            await self.message.edit(embed=discord.Embed(description=text))
+        self.edits += 1
+
+    async def finish(self, text=None):
+        # text, when given, replaces the part not yet settled (e.g. an error)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if text is not None:
+            self.text = self.text[:self.sent] + text
+        await self._flush(final=True)
+
+outbox = Outbox()
+metrics.collector("outbox_queued", "gauge", "Texts waiting for a channel sender.",
+                  lambda: sum(len(q) for q in outbox.queues.values()))
+metrics.collector("messages_sent", "counter", "Packed messages sent by the outbox.", lambda: outbox.messages_sent)
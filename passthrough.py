@@ -0,0 +1,19 @@
+import discord
+from discord.sinks import RawData
+
+# Imported only when LIVE_OPUS is on: subclassing VoiceClient needs the voice
+# dependencies (PyNaCl) installed.
+
+class PassthroughVoiceClient(discord.VoiceClient):
+    # Hands decrypted Opus packets to sinks that take them (write_packet)
+    # instead of decoding them to PCM; other sinks record as usual
+    def unpack_audio(self, data):
+        if not hasattr(self.sink, "write_packet"):
+            return super().unpack_audio(data)
+        if 200 <= data[1] <= 204 or self.paused:
+            return  # RTCP, or recording paused
+        data = RawData(data, self)
+        if data.decrypted_data == b"\xf8\xff\xfe":  # silence frame
+            return
+        user = self.ws.ssrc_map.get(data.ssrc, {}).get("user_id")
+        self.sink.write_packet(data.ssrc, user, data.sequence, data.decrypted_data)
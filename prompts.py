@@ -50,3 +50,69 @@ ASSESS_SYS = (
 ASSESS_USER = (
     "Transcript (oldest→newest):\n\n{transcript}"
 )
+# Fused ASSESS + summary for transcripts the local pre-check cannot settle
+ASSESS_SUMM_SYS = (
+    SUMM_SYS + "\n\n"
+    "First decide whether the transcript is a true debate, where two main participants present conflicting "
+    "arguments. Reply with a single JSON object only, with these keys:\n"
+    "  \"debate\": true or false.\n"
+    "  \"summary\": the summary described above if it is a debate, otherwise an empty string."
+)
+ASSESS_SUMM_USER = (
+    "Transcript (oldest→newest), each line prefixed by speaker display name:\n\n"
+    "{transcript}"
+)
+# Prompt templates for the rolling notes kept during a live voice debate
+LIVE_STATE_SYS = (
+    "You are an impartial debate referee keeping running notes on a live voice debate. "
+    "You receive the current notes as JSON and the transcript of the latest segment. "
+    "Reply with a single JSON object only, with these keys:\n"
+    "  \"segment_summary\": a concise summary of the main points made in the latest segment.\n"
+    "  \"summary\": a running summary of the whole debate so far (150 words max).\n"
+    "  \"claims\": an object mapping each speaker display name to a list of their key claims, "
+    "each with a short direct quote.\n"
+    "  \"contested\": a list of points in dispute, naming who holds which side.\n"
+    "  \"unanswered\": a list of questions still unanswered, naming who asked whom.\n"
+    "Keep each list to the 10 most important items, merging or dropping points that were settled."
+)
+LIVE_STATE_USER = (
+    "Current notes:\n{state}\n\n"
+    "Latest segment transcript (oldest→newest):\n{transcript}"
+)
+LIVE_FINAL_USER = (
+    "This debate was reviewed live. Below are the referee's running notes on the whole debate, "
+    "followed by the transcript of the final minutes that the notes do not cover yet.\n\n"
+    "Running notes:\n{state}\n\n"
+    "Final segment transcript (oldest→newest), each line prefixed by speaker display name:\n\n"
+    "{transcript}\n\n"
+    "Apply the review instructions above and deliver the complete analysis."
+)
+# Prompt templates for map-reduce over transcripts that exceed the context window
+CHUNK_SYS = (
+    "You are an impartial debate referee taking notes on one part of a longer Discord debate transcript. "
+    "List, attributing everything by speaker display name:\n"
+    "  • Each substantive claim, with a direct quote (one sentence max).\n"
+    "  • Rebuttals, and which claim they answer.\n"
+    "  • Questions asked, and whether they were answered or evaded.\n"
+    "  • Dishonest tactics or logical fallacies, with the problematic quote.\n"
+    "Be terse and factual; these notes will be merged with notes on the other parts."
+)
+CHUNK_USER = (
+    "Part {part} of {parts} of the transcript (oldest→newest), each line prefixed by speaker display name:\n\n"
+    "{transcript}\n\n"
+    "Produce the notes for this part."
+)
+MERGE_SYS = (
+    "You are an impartial debate referee merging notes taken on consecutive parts of one Discord debate. "
+    "Combine them into a single set of notes in the same format. Keep every attribution and direct quote, "
+    "merge duplicates, and mark claims that were later rebutted or conceded."
+)
+MERGE_USER = (
+    "Notes on consecutive parts of the debate (oldest→newest):\n\n{findings}"
+)
+REDUCE_USER = (
+    "The transcript was too long to review at once. Below are referee notes on consecutive parts of it "
+    "(oldest→newest), with speaker display names and direct quotes:\n\n"
+    "{findings}\n\n"
+    "Apply the instructions above to the debate these notes describe."
+)
@@ -0,0 +1,199 @@
+import collections
+import threading
+import time
+import numpy as np
+from discord.sinks import Filters, Sink
+from audio import FRAME_BYTES, FRAME_MS, SAMPLE_WIDTH
+from oggopus import OggOpusWriter
+from spool import PCMBuffer
+from config import (
+    VAD_THRESHOLD, VAD_SILENCE_MS, VAD_MIN_SPEECH_MS, VAD_MAX_UTTERANCE_MS, VAD_PREROLL_MS,
+)
+
+# One rotated window of a SegmentSink: per-speaker PCMBuffers (the consumer
+# closes them) and the window's wall-clock span
+Segment = collections.namedtuple("Segment", "buffers start end")
+
+class SegmentSink(Sink):
+    # Double-buffered per-speaker PCM for one long-lived recording. rotate()
+    # swaps in an empty buffer set under the lock and hands the finished one
+    # to on_segment(segment), so the receive thread never stops writing and no
+    # packet falls between two segments; cleanup() hands off the last one.
+    # rotate() may be called from any thread, so on_segment must be thread-safe.
+    def __init__(self, on_segment, *, filters=None):
+        super().__init__(filters=filters)
+        self.on_segment = on_segment
+        self.buffers = {}
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.bytes_in = 0
+
+    @Filters.container
+    def write(self, data, user):
+        with self.lock:
+            self.bytes_in += len(data)
+            buf = self.buffers.get(user)
+            if buf is None:
+                buf = self.buffers[user] = PCMBuffer()
+            buf.write(data)
+
+    def rotate(self):
+        now = time.time()
+        with self.lock:
+            buffers, self.buffers = self.buffers, {}
+            start, self.start = self.start, now
+        self.on_segment(Segment(buffers, start, now))
+
+    def cleanup(self):
+        self.finished = True
+        self.rotate()
+
+class OpusSegmentSink(SegmentSink):
+    # SegmentSink for a passthrough.PassthroughVoiceClient: keeps each speaker's Opus
+    # packets as received, muxed into one Ogg stream per speaker and segment.
+    # Streams are keyed by SSRC while recording and by user once rotated.
+    # Decoded PCM (from a plain VoiceClient) is still buffered as before.
+    def __init__(self, on_segment, *, filters=None):
+        super().__init__(on_segment, filters=filters)
+        self.users = {}
+        self.last_sequence = {}
+
+    def write_packet(self, ssrc, user, sequence, payload):
+        if self.filtered_users and user not in self.filtered_users:
+            return
+        with self.lock:
+            self.bytes_in += len(payload)
+            if user is not None:
+                self.users[ssrc] = user
+            last = self.last_sequence.get(ssrc)
+            # drop duplicates and late (reordered) packets
+            if last is not None and not 0 < (sequence - last) & 0xFFFF < 0x8000:
+                return
+            self.last_sequence[ssrc] = sequence
+            stream = self.buffers.get(("opus", ssrc))
+            if stream is None:
+                stream = self.buffers[("opus", ssrc)] = OggOpusWriter()
+            stream.write(payload)
+
+    def rotate(self):
+        now = time.time()
+        with self.lock:
+            buffers, self.buffers = self.buffers, {}
+            start, self.start = self.start, now
+            users = dict(self.users)
+        segment = {}
+        for key, buf in buffers.items():
+            if isinstance(key, tuple):
+                buf.finish()
+                ssrc = key[1]
+                key = users.get(ssrc, ssrc)
+                if key in segment:
+                    key = ssrc  # the same user on a second SSRC (rejoined)
+            segment[key] = buf
+        self.on_segment(Segment(segment, start, now))
+
+class _Speaker:
+    __slots__ = ("pending", "preroll", "frames", "voiced", "silent", "start", "last_write")
+
+    def __init__(self):
+        self.pending = bytearray()  # partial frame carried over between writes
+        self.preroll = collections.deque(maxlen=max(1, VAD_PREROLL_MS // FRAME_MS))
+        self.frames = None  # PCM of the open utterance, None while silent
+        self.voiced = 0
+        self.silent = 0
+        self.start = 0.0
+        self.last_write = 0.0
+
+class UtteranceSink(Sink):
+    # Energy-based voice activity detection per speaker. Each utterance is closed
+    # after VAD_SILENCE_MS of silence (or at VAD_MAX_UTTERANCE_MS) and handed to
+    # on_utterance(user_id, pcm, start_ts, end_ts) straight away; pcm is a
+    # PCMBuffer the receiver must close. write() runs on
+    # the voice receive thread, so on_utterance must be thread-safe.
+    def __init__(self, on_utterance, *, filters=None):
+        super().__init__(filters=filters)
+        self.on_utterance = on_utterance
+        self.speakers = {}
+        self.lock = threading.Lock()
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @Filters.container
+    def write(self, data, user):
+        now = time.time()
+        closed = []
+        with self.lock:
+            self.bytes_in += len(data)
+            sp = self.speakers.get(user)
+            if sp is None:
+                sp = self.speakers[user] = _Speaker()
+            sp.last_write = time.monotonic()
+            sp.pending += data
+            n = len(sp.pending) - len(sp.pending) % FRAME_BYTES
+            if not n:
+                return
+            chunk = bytes(sp.pending[:n])
+            del sp.pending[:n]
+            samples = np.frombuffer(chunk, dtype="<i2").reshape(-1, FRAME_BYTES // SAMPLE_WIDTH)
+            rms = np.sqrt(np.mean(np.square(samples, dtype=np.float32), axis=1))
+            count = len(rms)
+            for i, loud in enumerate((rms > VAD_THRESHOLD).tolist()):
+                frame = chunk[i * FRAME_BYTES:(i + 1) * FRAME_BYTES]
+                if sp.frames is None:
+                    if loud:
+                        sp.frames = PCMBuffer()
+                        sp.frames.write(b"".join(sp.preroll))
+                        sp.start = now - (count - i + len(sp.preroll)) * FRAME_MS / 1000
+                        sp.preroll.clear()
+                        sp.frames.write(frame)
+                        sp.voiced, sp.silent = 1, 0
+                    else:
+                        sp.preroll.append(frame)
+                    continue
+                sp.frames.write(frame)
+                if loud:
+                    sp.voiced += 1
+                    sp.silent = 0
+                else:
+                    sp.silent += 1
+                if (sp.silent * FRAME_MS >= VAD_SILENCE_MS
+                        or len(sp.frames) >= VAD_MAX_UTTERANCE_MS // FRAME_MS * FRAME_BYTES):
+                    end = now - (count - i - 1) * FRAME_MS / 1000
+                    self._close(user, sp, end, closed)
+        self._emit(closed)
+
+    def poll(self):
+        # Close utterances of speakers whose packets stopped arriving; Discord
+        # sends nothing while a user is muted or not speaking.
+        now = time.monotonic()
+        closed = []
+        with self.lock:
+            for user, sp in self.speakers.items():
+                if sp.frames is not None and (now - sp.last_write) * 1000 >= VAD_SILENCE_MS:
+                    self._close(user, sp, time.time(), closed)
+        self._emit(closed)
+
+    def cleanup(self):
+        self.finished = True
+        closed = []
+        with self.lock:
+            for user, sp in self.speakers.items():
+                if sp.frames is not None:
+                    self._close(user, sp, time.time(), closed)
+        self._emit(closed)
+
+    def _close(self, user, sp, end, closed):
+        frames, voiced, silent = sp.frames, sp.voiced, sp.silent
+        sp.frames = None
+        sp.voiced = sp.silent = 0
+        if voiced * FRAME_MS < VAD_MIN_SPEECH_MS:
+            frames.close()
+            return
+        # keep a preroll's worth of trailing silence, drop the rest
+        frames.truncate(len(frames) - max(0, silent - sp.preroll.maxlen) * FRAME_BYTES)
+        self.bytes_out += len(frames)
+        closed.append((user, frames, sp.start, end))
+
+    def _emit(self, closed):
+        for user, pcm, start, end in closed:
+            self.on_utterance(user, pcm, start, end)
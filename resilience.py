@@ -0,0 +1,214 @@
+import asyncio
+import contextlib
+import contextvars
+import random
+import time
+import aiohttp
+import openai
+from config import (
+    OPENAI_TIMEOUT, OPENAI_RETRIES, RETRY_BASE_DELAY, RETRY_MAX_DELAY,
+    BREAKER_FAILURES, BREAKER_COOLDOWN, HEDGE_KINDS, HEDGE_MIN_SAMPLES,
+)
+import metrics
+
+# Retries, deadlines, hedging and circuit breaking for model calls. gateway.py
+# hands call() a function that makes one attempt; everything here decides
+# whether, when and how often to run it.
+#
+# A deadline covers everything awaited inside its block, including tasks
+# started there (they inherit the context): map-reduce chunks, merges and
+# speculative work all draw on the same end-to-end budget.
+
+class DeadlineExceeded(Exception):
+    pass
+
+class CircuitOpen(Exception):
+    pass
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+@contextlib.contextmanager
+def deadline(seconds):
+    # Nested deadlines never extend the outer one
+    end = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(end if outer is None else min(end, outer))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def remaining():
+    end = _deadline.get()
+    return None if end is None else end - time.monotonic()
+
+class CircuitBreaker:
+    # Opens after `failures` consecutive server-side failures; while open,
+    # calls fail at once. After `cooldown` one probe is let through: success
+    # closes the circuit, failure opens it for another cooldown.
+    def __init__(self, endpoint, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.endpoint = endpoint
+        self.failures = failures
+        self.cooldown = cooldown
+        self.streak = 0
+        self.opened = None
+        self.probe = None  # when the half-open probe was let through
+
+    @property
+    def open(self):
+        return self.opened is not None
+
+    def check(self):
+        if self.opened is None:
+            return
+        now = time.monotonic()
+        wait = self.opened + self.cooldown - now
+        # a probe that never reported back (cancelled) is replaced after a timeout
+        if wait > 0 or (self.probe is not None and now - self.probe < OPENAI_TIMEOUT):
+            raise CircuitOpen(
+                f"the OpenAI {self.endpoint} API is failing; paused for {max(1, round(wait))}s"
+            )
+        self.probe = now
+
+    def success(self):
+        self.streak = 0
+        self.opened = self.probe = None
+
+    def failure(self):
+        self.streak += 1
+        if self.probe is not None or self.streak >= self.failures:
+            if self.opened is None:
+                metrics.inc("circuit_trips", endpoint=self.endpoint)
+            self.opened = time.monotonic()
+            self.probe = None
+
+breakers = {endpoint: CircuitBreaker(endpoint) for endpoint in ("chat", "whisper")}
+metrics.collector("circuit_open", "gauge", "1 while an endpoint's circuit breaker is open.", lambda: {
+    endpoint: int(b.open) for endpoint, b in breakers.items()
+}, label="endpoint")
+
+# Failures that say the API itself is in trouble
+_SERVER_SIDE = ("timeout", "connection", "unavailable", "server")
+
+def _classify(e):
+    # (retryable, reason)
+    if isinstance(e, DeadlineExceeded):
+        return False, "deadline"
+    if isinstance(e, (asyncio.TimeoutError, openai.error.Timeout)):
+        return True, "timeout"
+    if isinstance(e, openai.error.RateLimitError):
+        # an exhausted quota will not come back by retrying
+        return getattr(e, "code", None) != "insufficient_quota", "rate_limit"
+    if isinstance(e, (openai.error.APIConnectionError, aiohttp.ClientError)):
+        return True, "connection"
+    if isinstance(e, (openai.error.ServiceUnavailableError, openai.error.TryAgain)):
+        return True, "unavailable"
+    if isinstance(e, openai.error.APIError):
+        status = getattr(e, "http_status", None)
+        if status is None or status >= 500:
+            return True, "server"
+    if isinstance(e, openai.error.OpenAIError):
+        return False, "client"
+    return False, "other"
+
+def _retry_after(e):
+    headers = getattr(e, "headers", None) or {}
+    try:
+        return max(0.0, float(headers.get("Retry-After") or headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+def _hedge_delay(kind):
+    if kind not in HEDGE_KINDS:
+        return None
+    hist = metrics.registry.histograms["openai_seconds"].get((("kind", kind),))
+    if hist is None or hist.count < HEDGE_MIN_SAMPLES:
+        return None
+    return hist.quantile(0.95)
+
+async def _hedged(attempt, kind, delay):
+    # A second copy of the request once the first runs past the p95; the
+    # first success wins and the other is cancelled
+    first = asyncio.ensure_future(attempt())
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+    metrics.inc("hedges", kind=kind, outcome="sent")
+    second = asyncio.ensure_future(attempt())
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    metrics.inc("hedges", kind=kind, outcome="won" if task is second else "lost")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+def timeout():
+    # For one attempt, taken once it holds its concurrency slots: queueing
+    # counts against the deadline but is never mistaken for a slow API
+    left = remaining()
+    if left is None:
+        return OPENAI_TIMEOUT
+    if left <= 0:
+        raise DeadlineExceeded("no reply from OpenAI within the time budget")
+    return min(OPENAI_TIMEOUT, left)
+
+async def bounded(request):
+    # Awaits request(seconds) for at most timeout() seconds. When the step's
+    # deadline rather than OPENAI_TIMEOUT cut it short, raises DeadlineExceeded:
+    # the API was not necessarily slow, so the breaker must not count it
+    limit = timeout()
+    try:
+        return await asyncio.wait_for(request(limit), limit)
+    except (asyncio.TimeoutError, openai.error.Timeout) as e:
+        if limit < OPENAI_TIMEOUT:
+            raise DeadlineExceeded("no reply from OpenAI within the time budget") from e
+        raise
+
+async def call(endpoint, kind, attempt, retry=lambda: True, hedge=True):
+    # attempt() makes one request, through bounded(). retry() says whether
+    # a failed attempt may be repeated (not once a streamed reply has reached
+    # the user). Raises the last error, CircuitOpen or DeadlineExceeded.
+    breaker = breakers[endpoint]
+    hedge = _hedge_delay(kind) if hedge else None
+    tries = 0
+    while True:
+        left = remaining()
+        if left is not None and left <= 0:
+            raise DeadlineExceeded(f"no reply from OpenAI within the time budget ({kind})")
+        breaker.check()
+        try:
+            if hedge is not None and hedge < (OPENAI_TIMEOUT if left is None else min(OPENAI_TIMEOUT, left)):
+                result = await _hedged(attempt, kind, hedge)
+            else:
+                result = await attempt()
+        except Exception as e:
+            retryable, reason = _classify(e)
+            if reason in _SERVER_SIDE:
+                breaker.failure()
+            elif reason in ("rate_limit", "client"):
+                breaker.success()  # a 429 or a bad request still shows the API is up
+            tries += 1
+            metrics.inc("openai_errors", endpoint=endpoint, reason=reason)
+            # full jitter, but never sooner than the server asked for
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (tries - 1)))
+            after = _retry_after(e)
+            if after is not None:
+                delay = max(delay, after)
+            left = remaining()
+            if not retryable or tries > OPENAI_RETRIES or not retry() or (left is not None and delay >= left):
+                if reason == "timeout":
+                    raise DeadlineExceeded(f"no reply from OpenAI in time ({kind})") from e
+                raise
+            metrics.inc("openai_retries", endpoint=endpoint, reason=reason)
+            await asyncio.sleep(delay)
+            continue
+        breaker.success()
+        return result
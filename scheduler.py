@@ -0,0 +1,161 @@
+import asyncio
+import collections
+import contextlib
+import traceback
+
+# Lower number runs first; live voice work must never wait behind text audits
+PRIORITY_LIVE = 0
+PRIORITY_TEXT = 1
+
+class _Job:
+    __slots__ = ("fn", "args", "future", "started")
+
+    def __init__(self, fn, args, future):
+        self.fn = fn
+        self.args = args
+        self.future = future
+        self.started = False
+
+class Scheduler:
+    # Runs handler coroutines with at most max_in_flight at once. Waiting jobs
+    # sit in bounded per-guild queues; each priority level is served
+    # round-robin across guilds so one busy server cannot starve the others.
+    # Live work is queued per voice room instead, so rooms in one server are
+    # served in turn as well.
+    def __init__(self, max_in_flight, guild_queue):
+        self.max_in_flight = max_in_flight
+        self.guild_queue = guild_queue
+        self.rings = [collections.OrderedDict() for _ in (PRIORITY_LIVE, PRIORITY_TEXT)]
+        self.queued = collections.Counter()
+        self.in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.tasks = set()
+
+    def submit(self, guild_id, priority, fn, *args, future=None):
+        # Returns 0 if the job started right away, its position in the guild's
+        # queue if it has to wait, or None if that queue is full (live jobs are
+        # never rejected).
+        if priority != PRIORITY_LIVE and self.queued[guild_id] >= self.guild_queue:
+            self.rejected += 1
+            return None
+        job = _Job(fn, args, future)
+        queue = self.rings[priority].setdefault(guild_id, collections.deque())
+        queue.append(job)
+        self.queued[guild_id] += 1
+        self.submitted += 1
+        self._pump()
+        return 0 if job.started else len(queue)
+
+    async def run(self, guild_id, priority, fn, *args):
+        # Like submit, but waits for the job and returns its result
+        future = asyncio.get_running_loop().create_future()
+        self.submit(guild_id, priority, fn, *args, future=future)
+        return await future
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "queued_live": sum(len(q) for q in self.rings[PRIORITY_LIVE].values()),
+            "queued_text": sum(len(q) for q in self.rings[PRIORITY_TEXT].values()),
+            "queued_guilds": sum(1 for n in self.queued.values() if n),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+    def _next(self):
+        for ring in self.rings:
+            if ring:
+                guild_id, queue = next(iter(ring.items()))
+                job = queue.popleft()
+                if queue:
+                    ring.move_to_end(guild_id)
+                else:
+                    del ring[guild_id]
+                self.queued[guild_id] -= 1
+                if not self.queued[guild_id]:
+                    del self.queued[guild_id]
+                return job
+        return None
+
+    def _pump(self):
+        while self.in_flight < self.max_in_flight:
+            job = self._next()
+            if job is None:
+                return
+            job.started = True
+            self.in_flight += 1
+            task = asyncio.get_running_loop().create_task(self._run(job))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, job):
+        try:
+            result = await job.fn(*job.args)
+        except Exception as e:
+            self.failed += 1
+            if job.future is None:
+                traceback.print_exc()
+            elif not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if job.future is not None and not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._pump()
+
+class FairLimiter:
+    # A semaphore whose free slots are handed out round-robin across keys
+    # rather than first come, first served: a room with ten speakers queues
+    # ten uploads, but a room with two still gets every other free slot.
+    def __init__(self, limit):
+        self.limit = limit
+        self.held = 0
+        self.waiters = collections.OrderedDict()  # key -> deque of futures
+
+    @contextlib.asynccontextmanager
+    async def slot(self, key):
+        if self.held < self.limit and not self.waiters:
+            self.held += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self.waiters.setdefault(key, collections.deque()).append(future)
+            try:
+                await future
+            except BaseException:
+                if future.done() and not future.cancelled():
+                    self._release()  # handed a slot just as we were cancelled
+                else:
+                    queue = self.waiters.get(key)
+                    if queue is not None and future in queue:
+                        queue.remove(future)
+                        if not queue:
+                            del self.waiters[key]
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def waiting(self):
+        return sum(len(q) for q in self.waiters.values())
+
+    def _release(self):
+        # The slot passes straight to the next key's oldest waiter
+        while self.waiters:
+            key, queue = next(iter(self.waiters.items()))
+            future = queue.popleft()
+            if queue:
+                self.waiters.move_to_end(key)
+            else:
+                del self.waiters[key]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.held -= 1
@@ -0,0 +1,203 @@
+import collections
+import json
+import os
+import sys
+import time
+
+class AuditSession:
+    # One multi-step text audit, keyed by (thread_id, user_id)
+    __slots__ = (
+        "state", "transcript", "summary", "bad_count", "start_message_id", "channel_id",
+        "prompt_id", "created", "touched",
+    )
+    persistent = True
+
+    def __init__(self, state, transcript, summary=None, bad_count=0, start_message_id=None,
+                 channel_id=None, prompt_id=None, created=None, touched=None):
+        self.state = state
+        self.transcript = transcript
+        self.summary = summary
+        self.bad_count = bad_count
+        self.start_message_id = start_message_id
+        self.channel_id = channel_id
+        self.prompt_id = prompt_id
+        self.created = created or time.time()
+        self.touched = touched or self.created
+
+    def nbytes(self):
+        size = sys.getsizeof(self)
+        for name in ("state", "transcript", "summary"):
+            value = getattr(self, name)
+            if value:
+                size += len(value.encode("utf-8"))
+        return size
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data.get(name) for name in cls.__slots__ if name in data})
+
+class LiveSession:
+    # One live voice debate, keyed by its voice channel (the room); holds
+    # connections and tasks, so it is never persisted
+    __slots__ = (
+        "voice_client", "guild_id", "room", "thread", "recording", "stopped", "full_transcript", "state",
+        "state_lock", "unfolded", "task", "current_sink", "stream_done", "created", "touched",
+    )
+    persistent = False
+
+    def __init__(self, voice_client, thread, state, state_lock, stopped, full_transcript):
+        self.voice_client = voice_client
+        self.guild_id = voice_client.guild.id
+        self.room = voice_client.channel.id
+        self.thread = thread
+        self.recording = True
+        self.stopped = stopped
+        self.full_transcript = full_transcript
+        self.state = state
+        self.state_lock = state_lock
+        self.unfolded = []  # transcript segments not yet folded into the notes
+        self.task = None
+        self.current_sink = None
+        self.stream_done = None
+        self.created = self.touched = time.time()
+
+    def nbytes(self):
+        return sys.getsizeof(self) + self.full_transcript.nbytes()
+
+class SessionStore:
+    # Dict-like session table with TTL expiry, LRU eviction by count and by
+    # accounted bytes, and an optional JSONL append log. Records from the log
+    # are only rebuilt when their key is first looked up again.
+    def __init__(self, record_type, ttl=None, max_entries=None, max_bytes=None, path=""):
+        self.record_type = record_type
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.records = collections.OrderedDict()
+        self.sizes = {}
+        self.bytes = 0
+        self.evictions = 0
+        self.path = path
+        self.cold = {}  # key -> dict from the log, not rebuilt yet
+        self.log_lines = 0
+        self.on_evict = None  # called with the key of each expired or evicted record
+        if path and os.path.exists(path):
+            self._read_log()
+
+    def __len__(self):
+        return len(self.records) + len(self.cold)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        record = self.get(key)
+        if record is None:
+            raise KeyError(key)
+        return record
+
+    def __setitem__(self, key, record):
+        record.touched = time.time()
+        self.cold.pop(key, None)
+        self._account(key, record)
+        self.records[key] = record
+        self.records.move_to_end(key)
+        self._append(key, record)
+        self.evict()
+
+    def get(self, key, default=None):
+        record = self.records.get(key)
+        if record is None and key in self.cold:
+            record = self.record_type.from_dict(self.cold.pop(key))
+            self.records[key] = record
+            self._account(key, record)
+        if record is None:
+            return default
+        if self._expired(record):
+            self._evict(key)
+            return default
+        record.touched = time.time()
+        self.records.move_to_end(key)
+        return record
+
+    def pop(self, key, default=None):
+        record = self.records.pop(key, None)
+        cold = self.cold.pop(key, None)
+        if record is None and cold is None:
+            return default
+        self.bytes -= self.sizes.pop(key, 0)
+        self._append(key, None)
+        return record if record is not None else self.record_type.from_dict(cold)
+
+    def values(self):
+        return list(self.records.values())
+
+    def evict(self):
+        now = time.time()
+        for key in [k for k, r in self.records.items() if self._expired(r, now)]:
+            self._evict(key)
+        while self.records and (
+            (self.max_entries and len(self.records) > self.max_entries)
+            or (self.max_bytes and self.bytes > self.max_bytes)
+        ):
+            self._evict(next(iter(self.records)))
+
+    def _evict(self, key):
+        self.pop(key)
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(key)
+
+    def _expired(self, record, now=None):
+        return self.ttl is not None and (now or time.time()) - record.touched > self.ttl
+
+    def _account(self, key, record):
+        size = record.nbytes()
+        self.bytes += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+
+    def _append(self, key, record):
+        if not self.path or not self.record_type.persistent:
+            return
+        entry = {"key": list(key) if isinstance(key, tuple) else key,
+                 "record": record.to_dict() if record is not None else None}
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        self.log_lines += 1
+        # Rewrite the log once it is mostly superseded entries
+        if self.log_lines > 1000 and self.log_lines > 4 * len(self):
+            self.compact()
+
+    def _read_log(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                self.log_lines += 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn write from a crash
+                key = tuple(entry["key"]) if isinstance(entry["key"], list) else entry["key"]
+                if entry["record"] is None:
+                    self.cold.pop(key, None)
+                else:
+                    self.cold[key] = entry["record"]
+        now = time.time()
+        if self.ttl is not None:
+            self.cold = {k: v for k, v in self.cold.items() if now - v.get("touched", 0) <= self.ttl}
+
+    def compact(self):
+        # Rewrites the log with one entry per live record. It replaces the
+        # file, so only the process appending to it (the bot) may call this;
+        # other processes that import config just read the log
+        if not self.path or not self.record_type.persistent:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for key, data in list(self.cold.items()) + [(k, r.to_dict()) for k, r in self.records.items()]:
+                entry = {"key": list(key) if isinstance(key, tuple) else key, "record": data}
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp, self.path)
+        self.log_lines = len(self)
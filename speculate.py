@@ -0,0 +1,59 @@
+import asyncio
+import time
+import metrics
+from config import sessions, SPECULATE_MAX_TASKS, SPECULATE_TTL
+
+class Speculator:
+    # Background work started on a guess of the user's next reply, keyed by
+    # (session key, kind). A reply that matches takes the task, which counts
+    # as used once it delivers a result; one that fails, or is not taken
+    # within ttl, or is dropped with its session, counts as wasted.
+    def __init__(self, max_tasks=SPECULATE_MAX_TASKS, ttl=SPECULATE_TTL):
+        self.max_tasks = max_tasks
+        self.ttl = ttl
+        self.entries = {}  # (key, kind) -> (task, deadline)
+
+    def start(self, key, kind, coro):
+        self._expire()
+        running = sum(1 for task, _ in self.entries.values() if not task.done())
+        if (key, kind) in self.entries or running >= self.max_tasks:
+            coro.close()
+            metrics.inc("speculations", kind=kind, outcome="skipped")
+            return False
+        task = asyncio.create_task(asyncio.wait_for(coro, self.ttl))
+        # failures surface when the task is taken; don't warn about unread ones
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self.entries[(key, kind)] = (task, time.monotonic() + self.ttl)
+        metrics.inc("speculations", kind=kind, outcome="started")
+        return True
+
+    def take(self, key, kind):
+        self._expire()
+        entry = self.entries.pop((key, kind), None)
+        if entry is None:
+            return None
+        # the caller recomputes if it failed
+        entry[0].add_done_callback(lambda t: metrics.inc(
+            "speculations", kind=kind, outcome="wasted" if t.cancelled() or t.exception() else "used",
+        ))
+        return entry[0]
+
+    def discard(self, key):
+        for entry_key in [k for k in self.entries if k[0] == key]:
+            self._drop(entry_key)
+
+    def _expire(self):
+        now = time.monotonic()
+        for entry_key in [k for k, (_, deadline) in self.entries.items() if deadline <= now]:
+            self._drop(entry_key)
+
+    def _drop(self, entry_key):
+        task, _ = self.entries.pop(entry_key)
+        task.cancel()
+        metrics.inc("speculations", kind=entry_key[1], outcome="wasted")
+
+speculator = Speculator()
+# An audit session's speculations go with it when the store evicts it
+sessions.on_evict = speculator.discard
+metrics.collector("speculations_pending", "gauge", "Speculative results waiting for a reply.",
+                  lambda: len(speculator.entries))
@@ -0,0 +1,122 @@
+import mmap
+import os
+import tempfile
+import threading
+from config import AUDIO_MEMORY_BYTES, AUDIO_SPOOL_DIR
+import metrics
+
+# Recorded PCM per speaker. A buffer grows in memory while every live buffer
+# together stays under AUDIO_MEMORY_BYTES; past that it moves to a temp file
+# and keeps appending there, so RAM stays flat however many people talk.
+# view() is a zero-copy memoryview either way (an mmap for spooled buffers),
+# and a spooled buffer's path lets a worker process map the file itself.
+
+class Spool:
+    def __init__(self, limit, directory=None):
+        self.limit = limit
+        self.directory = directory or None
+        self.lock = threading.Lock()
+        self.memory = 0
+        self.disk = 0
+        self.spilled = 0
+
+    def reserve(self, n):
+        with self.lock:
+            if self.memory + n > self.limit:
+                return False
+            self.memory += n
+            return True
+
+    def account(self, memory=0, disk=0, spilled=0):
+        with self.lock:
+            self.memory += memory
+            self.disk += disk
+            self.spilled += spilled
+
+class PCMBuffer:
+    # Append-only; written by one thread at a time (the sink holds its lock)
+    __slots__ = ("spool", "data", "file", "path", "size", "_map")
+
+    def __init__(self, spool=None):
+        self.spool = spool or default_spool
+        self.data = bytearray()
+        self.file = None
+        self.path = None
+        self.size = 0
+        self._map = None
+
+    def __len__(self):
+        return self.size
+
+    def write(self, data):
+        n = len(data)
+        if self.file is None and not self.spool.reserve(n):
+            self._spill()
+        if self.file is None:
+            self.data += data
+        else:
+            self.file.write(data)
+            self.spool.account(disk=n)
+        self.size += n
+
+    def _spill(self):
+        fd, self.path = tempfile.mkstemp(prefix="debateauditor-", suffix=".pcm", dir=self.spool.directory)
+        self.file = os.fdopen(fd, "wb")
+        self.file.write(self.data)
+        self.spool.account(memory=-len(self.data), disk=len(self.data), spilled=1)
+        self.data = bytearray()
+
+    def truncate(self, size):
+        # Drops everything past size bytes (trailing silence)
+        size = min(size, self.size)
+        if self.file is None:
+            del self.data[size:]
+            self.spool.account(memory=size - self.size)
+        else:
+            self.file.flush()
+            self.file.truncate(size)
+            self.file.seek(size)
+            self.spool.account(disk=size - self.size)
+        self.size = size
+
+    def spooled_path(self):
+        # The flushed temp file, or None while the buffer is in memory
+        if self.file is None:
+            return None
+        self.file.flush()
+        return self.path
+
+    def view(self):
+        # Valid until close(); the buffer must not be written to meanwhile
+        if self.file is None:
+            return memoryview(self.data)
+        self.file.flush()
+        if not self.size:
+            return memoryview(b"")
+        if self._map is None:
+            self._map = mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ)
+        return memoryview(self._map)
+
+    def close(self):
+        if self.file is None:
+            self.spool.account(memory=-len(self.data))
+            self.data = bytearray()
+        else:
+            try:
+                if self._map is not None:
+                    self._map.close()
+            except BufferError:
+                pass  # a view is still exported; the map closes when it is collected
+            self.file.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self.spool.account(disk=-self.size)
+            self.file = self._map = None
+        self.size = 0
+
+default_spool = Spool(AUDIO_MEMORY_BYTES, AUDIO_SPOOL_DIR)
+metrics.collector("audio_buffer_bytes", "gauge", "Recorded PCM held in memory and spooled to disk.", lambda: {
+    "memory": default_spool.memory, "disk": default_spool.disk,
+}, label="where")
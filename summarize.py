@@ -0,0 +1,145 @@
+import asyncio
+import json
+import re
+import gateway
+import metrics
+from compact import TURN, split_turns
+from config import MODEL_CONTEXT_TOKENS, CHUNK_TOKENS, MAX_TOKENS
+from prompts import (
+    CHUNK_SYS, CHUNK_USER, MERGE_SYS, MERGE_USER, REDUCE_USER, ASSESS_SYS, ASSESS_USER, ASSESS_SUMM_SYS,
+    ASSESS_SUMM_USER,
+)
+from tokens import count_tokens
+
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+# Room left for chat formatting overhead
+_MARGIN = 64
+
+def prompt_budget(kind):
+    return MODEL_CONTEXT_TOKENS - MAX_TOKENS[kind] - _MARGIN
+
+def _split_turn(turn, budget):
+    # A single turn longer than the budget is cut on sentence boundaries and
+    # each piece keeps the speaker prefix
+    match = TURN.match(turn)
+    prefix = match.group(0) if match else ""
+    pieces, current, size = [], [], 0
+    for sentence in _SENTENCE.split(turn[len(prefix):]):
+        n = count_tokens(sentence) + 1
+        while n > budget:
+            # no sentence boundary to use: hard cut at an estimated length
+            cut = len(sentence) * budget // n
+            pieces.append(prefix + sentence[:cut])
+            sentence = sentence[cut:]
+            n = count_tokens(sentence) + 1
+        if current and size + n > budget:
+            pieces.append(prefix + " ".join(current))
+            current, size = [], 0
+        current.append(sentence)
+        size += n
+    if current:
+        pieces.append(prefix + " ".join(current))
+    return pieces
+
+def chunk_transcript(transcript, budget=CHUNK_TOKENS):
+    chunks, current, size = [], [], 0
+    for turn in split_turns(transcript):
+        n = count_tokens(turn) + 1
+        parts = _split_turn(turn, budget) if n > budget else [turn]
+        for part in parts:
+            n = count_tokens(part) + 1 if len(parts) > 1 else n
+            if current and size + n > budget:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            current.append(part)
+            size += n
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def fit_tail(transcript, budget):
+    # Most recent turns that fit in budget tokens, for prompts that only need a sample
+    kept, size = [], 0
+    for turn in reversed(split_turns(transcript)):
+        size += count_tokens(turn) + 1
+        if size > budget:
+            if not kept:
+                kept.append(_split_turn(turn, budget)[-1])
+            break
+        kept.append(turn)
+    return "\n".join(reversed(kept))
+
+async def map_chunks(transcript, guild_id=None):
+    chunks = chunk_transcript(transcript)
+    return await asyncio.gather(*(
+        gateway.chat(
+            "chunk", CHUNK_SYS,
+            CHUNK_USER.format(part=i + 1, parts=len(chunks), transcript=chunk),
+            guild_id=guild_id,
+        )
+        for i, chunk in enumerate(chunks)
+    ))
+
+def _join_findings(findings):
+    return "\n\n".join(f"Part {i + 1}:\n{f}" for i, f in enumerate(findings))
+
+async def reduce_findings(findings, system, kind, guild_id=None):
+    # Merge partial notes level by level until they fit the final prompt
+    budget = prompt_budget(kind) - count_tokens(system)
+    while len(findings) > 1 and count_tokens(REDUCE_USER.format(findings=_join_findings(findings))) > budget:
+        groups, current, size = [], [], 0
+        for f in findings:
+            n = count_tokens(f)
+            if len(current) >= 2 and size + n > CHUNK_TOKENS:
+                groups.append(current)
+                current, size = [], 0
+            current.append(f)
+            size += n
+        groups.append(current)
+        findings = await asyncio.gather(*(
+            gateway.chat("merge", MERGE_SYS, MERGE_USER.format(findings=_join_findings(g)), guild_id=guild_id)
+            if len(g) > 1 else asyncio.sleep(0, g[0])
+            for g in groups
+        ))
+    return _join_findings(findings)
+
+async def complete(kind, system, user_template, transcript, guild_id=None, on_text=None):
+    # One call when the transcript fits the context window, map-reduce otherwise;
+    # only the final call is streamed to on_text
+    user = user_template.format(transcript=transcript)
+    if count_tokens(system) + count_tokens(user) <= prompt_budget(kind):
+        return await gateway.chat(kind, system, user, guild_id=guild_id, on_text=on_text)
+    findings = await map_chunks(transcript, guild_id)
+    notes = await reduce_findings(findings, system, kind, guild_id)
+    return await gateway.chat(
+        kind, system, REDUCE_USER.format(findings=notes), guild_id=guild_id, on_text=on_text,
+    )
+
+async def assess_and_summarize(transcript, guild_id, fallback=True):
+    # Returns (is_debate, summary or None). One fused call answers both when
+    # the whole transcript fits; otherwise (or if its reply is unusable) a
+    # plain ASSESS on the most recent messages, leaving the summary to later.
+    # If ASSESS fails too, `fallback` (the local detector's lean) decides.
+    user = ASSESS_SUMM_USER.format(transcript=transcript)
+    if count_tokens(ASSESS_SUMM_SYS) + count_tokens(user) <= prompt_budget("assess_summary"):
+        try:
+            with metrics.timer("stage_seconds", stage="assess_summary"):
+                reply = await gateway.chat("assess_summary", ASSESS_SUMM_SYS, user, guild_id=guild_id)
+            data = json.loads(reply[reply.find("{"):reply.rfind("}") + 1])
+            summary = str(data.get("summary") or "").strip()
+            if data.get("debate") is False:
+                return False, None
+            if data.get("debate") is True and summary:
+                return True, summary
+        except Exception:
+            pass
+    try:
+        sample = fit_tail(transcript, prompt_budget("assess") - count_tokens(ASSESS_SYS + ASSESS_USER))
+        with metrics.timer("stage_seconds", stage="assess"):
+            assessment = await gateway.chat(
+                "assess", ASSESS_SYS, ASSESS_USER.format(transcript=sample), guild_id=guild_id,
+            )
+    except Exception:
+        metrics.inc("prechecks", result="fallback")
+        return fallback, None
+    return not assessment.lower().startswith("n"), None
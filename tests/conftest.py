@@ -0,0 +1,13 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules import each other by name, as when bot.py runs from the repo root;
+# the fake OpenAI server lives with the benchmarks
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+# Fresh in-memory state: no response cache, history or session log on disk
+os.environ["CACHE_PATH"] = ""
+os.environ["HISTORY_PATH"] = ""
+os.environ["SESSION_LOG"] = ""
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
@@ -0,0 +1,13 @@
+from compact import is_noise, normalize
+
+def test_normalize_keeps_figures():
+    assert normalize("it cost 10000 or 50000000 dollars") == "it cost 10000 or 50000000 dollars"
+
+def test_normalize_collapses_letter_and_punctuation_runs():
+    assert normalize("sooooo wrong!!!!!") == "sooo wrong!!!"
+
+def test_question_mark_is_a_turn():
+    assert not is_noise("?")
+    assert not is_noise("??")
+    assert is_noise("lol")
+    assert is_noise("!!!")
@@ -0,0 +1,20 @@
+import asyncio
+from fakes import FakeGuild, FakeUser
+from history import HistoryStore
+
+def test_before_survives_a_trim_during_a_fetch():
+    async def main():
+        channel = FakeGuild(FakeUser("DebateAuditor", bot=True)).add_channel("debate")
+        alice = FakeUser("Alice")
+        posted = [channel.post(alice, f"message {i}") for i in range(30)]
+        store = HistoryStore(max_messages=10, path="")
+        await store.before(channel, posted[20].id, 5)
+        # the first five are served from the store, the rest need a fetch;
+        # new messages arriving meanwhile trim the store below its window
+        task = asyncio.create_task(store.before(channel, posted[20].id, 10))
+        await asyncio.sleep(channel.latency / 2)
+        for i in range(12):
+            store.record(channel.post(alice, f"new {i}"))
+        result = await task
+        assert [m.content for m in result] == [f"message {i}" for i in range(10, 20)]
+    asyncio.run(main())
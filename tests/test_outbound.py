@@ -0,0 +1,41 @@
+import random
+from outbound import chunk_text
+
+def _content(chunks):
+    # Everything but fence lines, in order
+    return "".join(line for chunk in chunks for line in chunk.split("\n") if not line.lstrip().startswith("```"))
+
+def _fence_only(chunk):
+    lines = chunk.split("\n")
+    return any(line.lstrip().startswith("```") for line in lines) and all(
+        line.lstrip().startswith("```") or not line.strip() for line in lines
+    )
+
+def test_fence_opened_near_limit():
+    chunks = chunk_text("\n" + "a" * 50 + "\n```py\n", 60)
+    assert all(len(chunk) <= 60 for chunk in chunks)
+    assert not any(_fence_only(chunk) for chunk in chunks)
+
+def test_chunks_never_exceed_limit():
+    rng = random.Random(0)
+    for _ in range(500):
+        lines = []
+        for _ in range(rng.randint(1, 40)):
+            kind = rng.random()
+            if kind < 0.15:
+                lines.append(rng.choice(["```", "```py", "```python"]))
+            else:
+                lines.append("x" * rng.randint(0, 120))
+        text = "\n".join(lines)
+        limit = rng.randint(20, 200)
+        chunks = chunk_text(text, limit)
+        assert all(len(chunk) <= limit for chunk in chunks), (text, limit)
+        assert not any(_fence_only(chunk) for chunk in chunks)
+        assert _content(chunks) == _content([text])
+
+def test_code_block_reopened_across_chunks():
+    text = "intro\n```py\n" + "\n".join(f"line {i}" for i in range(40)) + "\n```\noutro"
+    chunks = chunk_text(text, 80)
+    assert len(chunks) > 1
+    for chunk in chunks[:-1]:
+        assert chunk.count("```") % 2 == 0
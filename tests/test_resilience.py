@@ -0,0 +1,49 @@
+import asyncio
+import time
+import openai
+from fake_openai import FakeOpenAI
+import gateway
+import resilience
+from prompts import ASSESS_SYS
+
+def _chat_under_deadline(seconds, latency, user):
+    # Seconds until gateway.chat gave up, and what it raised
+    async def main():
+        server = FakeOpenAI(latency=latency, jitter=0)
+        openai.api_base = await server.start()
+        start = time.perf_counter()
+        try:
+            with resilience.deadline(seconds):
+                await gateway.chat("assess", ASSESS_SYS, user)
+        except Exception as e:
+            return time.perf_counter() - start, e
+        finally:
+            await gateway.close()
+            await server.stop()
+        return time.perf_counter() - start, None
+    return asyncio.run(main())
+
+def test_handlers_share_gateway_and_resilience():
+    import handlers.text
+    import handlers.voice
+    for handler in (handlers.text, handlers.voice):
+        assert handler.gateway is gateway
+        assert handler.resilience is resilience
+
+def test_deadline_cuts_off_slow_call():
+    elapsed, error = _chat_under_deadline(1, latency=3, user="cut off")
+    assert isinstance(error, resilience.DeadlineExceeded)
+    assert elapsed < 2
+
+def test_deadline_timeouts_do_not_trip_breaker():
+    breaker = resilience.breakers["chat"]
+    for i in range(breaker.failures + 1):
+        _, error = _chat_under_deadline(0.2, latency=1, user=f"breaker {i}")
+        assert isinstance(error, resilience.DeadlineExceeded)
+    assert breaker.streak == 0
+    assert not breaker.open
+
+def test_call_finishes_within_deadline():
+    elapsed, error = _chat_under_deadline(5, latency=0.1, user="in time")
+    assert error is None
+    assert elapsed < 5
@@ -0,0 +1,25 @@
+import os
+from session_store import SessionStore, AuditSession
+
+def test_loading_log_leaves_file_alone(tmp_path):
+    path = str(tmp_path / "sessions.jsonl")
+    store = SessionStore(AuditSession, path=path)
+    for i in range(3):
+        store[(i, 1)] = AuditSession("awaiting_analysis", "transcript")
+    store.pop((0, 1))
+    inode, size = os.stat(path).st_ino, os.path.getsize(path)
+    reloaded = SessionStore(AuditSession, path=path)
+    assert (os.stat(path).st_ino, os.path.getsize(path)) == (inode, size)
+    assert len(reloaded) == 2
+
+def test_compact_keeps_live_records(tmp_path):
+    path = str(tmp_path / "sessions.jsonl")
+    store = SessionStore(AuditSession, path=path)
+    for i in range(3):
+        store[(i, 1)] = AuditSession("awaiting_analysis", "transcript")
+    store.pop((0, 1))
+    reloaded = SessionStore(AuditSession, path=path)
+    reloaded.compact()
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+    assert SessionStore(AuditSession, path=path).get((1, 1)).transcript == "transcript"
@@ -0,0 +1,38 @@
+import asyncio
+import metrics
+from session_store import SessionStore, AuditSession
+from speculate import Speculator
+
+def _count(kind, outcome):
+    return metrics.registry.counters["speculations"].get((("kind", kind), ("outcome", outcome)), 0)
+
+async def _fail():
+    raise RuntimeError("model error")
+
+def test_failed_speculation_counts_as_wasted():
+    async def main():
+        speculator = Speculator(ttl=5)
+        used, wasted = _count("test", "used"), _count("test", "wasted")
+        speculator.start("ok", "test", asyncio.sleep(0, "verdict"))
+        speculator.start("bad", "test", _fail())
+        assert await speculator.take("ok", "test") == "verdict"
+        results = await asyncio.gather(speculator.take("bad", "test"), return_exceptions=True)
+        assert isinstance(results[0], RuntimeError)
+        await asyncio.sleep(0)
+        assert (_count("test", "used"), _count("test", "wasted")) == (used + 1, wasted + 1)
+    asyncio.run(main())
+
+def test_evicted_session_drops_its_speculations():
+    async def main():
+        speculator = Speculator(ttl=5)
+        store = SessionStore(AuditSession, max_entries=1)
+        store.on_evict = speculator.discard
+        store[(1, 1)] = AuditSession("awaiting_analysis", "transcript")
+        speculator.start((1, 1), "test", asyncio.sleep(5))
+        task, _ = speculator.entries[((1, 1), "test")]
+        await asyncio.sleep(0)
+        store[(2, 1)] = AuditSession("awaiting_analysis", "transcript")
+        assert not speculator.entries
+        await asyncio.gather(task, return_exceptions=True)
+        assert task.cancelled()
+    asyncio.run(main())
@@ -0,0 +1,38 @@
+from tokens import count_tokens
+from transcript import Transcript
+
+def _debate(memory_limit=1 << 20):
+    transcript = Transcript(memory_limit)
+    for segment in range(4):
+        for i in range(3):
+            transcript.append(i % 2, f"Speaker{i % 2}", 0, 0, f"segment {segment} point {i}")
+        transcript.end_segment()
+    return transcript
+
+def _size(text):
+    return sum(count_tokens(line) + 1 for line in text.splitlines())
+
+def test_render_segment_reads_spilled_records():
+    transcript = _debate(memory_limit=256)
+    assert transcript.spilled
+    assert transcript.render_segment(1).splitlines() == [
+        "Speaker0: segment 1 point 0", "Speaker1: segment 1 point 1", "Speaker0: segment 1 point 2",
+    ]
+
+def test_tail_keeps_whole_segments():
+    transcript = _debate()
+    two = _size(transcript.render_segment(2) + "\n" + transcript.render_segment(3))
+    assert transcript.tail(two + 1) == (transcript.render_segment(2) + "\n" + transcript.render_segment(3), [2, 3])
+    # not enough room for segment 2 as a whole: none of it is kept
+    assert transcript.tail(two - 1) == (transcript.render_segment(3), [3])
+
+def test_tail_only_listed_segments():
+    transcript = _debate(memory_limit=256)
+    assert transcript.tail(10_000, [0, 2]) == (transcript.render_segment(0) + "\n" + transcript.render_segment(2), [0, 2])
+    assert transcript.tail(10_000, []) == ("", [])
+
+def test_tail_cuts_the_newest_segment_by_line():
+    transcript = _debate()
+    line = "Speaker0: segment 3 point 2"
+    # a partly kept segment is not reported as held in full
+    assert transcript.tail(count_tokens(line) + 1) == (line, [])
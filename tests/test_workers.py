@@ -0,0 +1,18 @@
+import asyncio
+import os
+from workers import WorkerPool
+
+def _die():
+    os._exit(1)
+
+def test_broken_pool_is_shut_down_once():
+    async def main():
+        pool = WorkerPool(2)
+        broken = pool._executor()
+        results = await asyncio.gather(*(pool.run(_die) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, Exception) for r in results)
+        assert broken._shutdown_thread
+        assert pool.restarts == 1
+        assert await pool.run(abs, -3) == 3
+        pool.close()
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+# tiktoken is optional; without it token counts are estimated from length
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_model = None
+_encoding = None
+
+def use_model(model):
+    # Worker processes are told the model by their pool initializer, so they
+    # never import config; the bot's own process reads it on first use
+    global _model, _encoding
+    _model = model
+    _encoding = None
+
+def _encoder():
+    global _encoding, tiktoken
+    if _model is None:
+        from config import OPENAI_MODEL
+        use_model(OPENAI_MODEL)
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.encoding_for_model(_model)
+        except Exception:
+            try:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                tiktoken = None
+    return _encoding
+
+def count_tokens(text):
+    enc = _encoder()
+    if enc is None:
+        return len(text) // 4 + 1
+    return len(enc.encode(text, disallowed_special=()))
@@ -0,0 +1,133 @@
+import array
+import itertools
+import json
+import tempfile
+from config import TRANSCRIPT_MEMORY_BYTES
+from tokens import count_tokens
+
+class Utterance:
+    __slots__ = ("speaker_id", "name", "start", "end", "text", "segment")
+
+    def __init__(self, speaker_id, name, start, end, text, segment=0):
+        self.speaker_id = speaker_id
+        self.name = name
+        self.start = start
+        self.end = end
+        self.text = text
+        self.segment = segment
+
+    def line(self):
+        return f"{self.name}: {self.text}"
+
+    def nbytes(self):
+        return len(self.text.encode("utf-8")) + len(self.name.encode("utf-8")) + 64
+
+class Transcript:
+    # Append-only record of a live debate. Recent records stay in memory; once
+    # they exceed memory_limit bytes the oldest are written to a temp file and
+    # read back only when a caller renders that range.
+    def __init__(self, memory_limit=TRANSCRIPT_MEMORY_BYTES):
+        self.memory_limit = memory_limit
+        self.hot = []
+        self.hot_bytes = 0
+        self.segment = 0
+        self.spilled = 0
+        self.offsets = array.array("q")  # file offset of each spilled record
+        self.file = None
+
+    def __len__(self):
+        return self.spilled + len(self.hot)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def append(self, speaker_id, name, start, end, text):
+        u = Utterance(speaker_id, name, start, end, text, self.segment)
+        self.hot.append(u)
+        self.hot_bytes += u.nbytes()
+        if self.hot_bytes > self.memory_limit:
+            self._spill()
+        return u
+
+    def end_segment(self):
+        # Returns the number of the segment just finished
+        self.segment += 1
+        return self.segment - 1
+
+    def records(self, start=0, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        for i in range(start, min(stop, self.spilled)):
+            yield self._read(i)
+        for i in range(max(start, self.spilled), stop):
+            yield self.hot[i - self.spilled]
+
+    def render(self, start=0, stop=None):
+        return "\n".join(u.line() for u in self.records(start, stop))
+
+    def render_segment(self, segment):
+        # Only the hot records are scanned unless the segment was spilled
+        first = len(self)
+        while first > 0 and self._record(first - 1).segment >= segment:
+            first -= 1
+        return "\n".join(u.line() for u in self.records(first) if u.segment == segment)
+
+    def tail(self, max_tokens, segments=None):
+        # The most recent whole segments (only those listed, if given) that fit
+        # in max_tokens; if even the newest does not fit, its most recent lines.
+        # Returns the text and the segments it holds in full.
+        wanted = None if segments is None else set(segments)
+        if wanted is not None and not wanted:
+            return "", []
+        oldest = min(wanted) if wanted else 0
+        kept, whole, used = [], [], 0
+        for segment, group in itertools.groupby(self._newest_first(oldest), key=lambda u: u.segment):
+            if wanted is not None and segment not in wanted:
+                continue
+            lines = [u.line() for u in group]
+            size = sum(count_tokens(line) + 1 for line in lines)
+            if used + size > max_tokens:
+                if not kept:
+                    for line in lines:
+                        used += count_tokens(line) + 1
+                        if used > max_tokens:
+                            break
+                        kept.append(line)
+                break
+            kept.extend(lines)
+            whole.append(segment)
+            used += size
+        return "\n".join(reversed(kept)), whole[::-1]
+
+    def nbytes(self):
+        return self.hot_bytes + self.offsets.itemsize * len(self.offsets)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _record(self, i):
+        return self._read(i) if i < self.spilled else self.hot[i - self.spilled]
+
+    def _newest_first(self, oldest_segment=0):
+        for i in range(len(self) - 1, -1, -1):
+            u = self._record(i)
+            if u.segment < oldest_segment:
+                return
+            yield u
+
+    def _spill(self):
+        if self.file is None:
+            self.file = tempfile.TemporaryFile()
+        self.file.seek(0, 2)
+        keep = len(self.hot) // 4
+        for u in self.hot[:len(self.hot) - keep]:
+            self.offsets.append(self.file.tell())
+            self.file.write(json.dumps([u.speaker_id, u.name, u.start, u.end, u.text, u.segment]).encode("utf-8") + b"\n")
+            self.hot_bytes -= u.nbytes()
+        self.spilled += len(self.hot) - keep
+        del self.hot[:len(self.hot) - keep]
+
+    def _read(self, i):
+        self.file.seek(self.offsets[i])
+        return Utterance(*json.loads(self.file.readline()))
@@ -0,0 +1,68 @@
+import asyncio
+import traceback
+import discord
+from config import VOICE_BOT_TOKENS
+
+# Extra bot accounts that only join voice channels. Discord gives each
+# account one voice connection per server, so a server recording several
+# debate rooms at once needs one account per room; commands, notes threads
+# and replies all stay with the main bot.
+
+class VoiceBots:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.clients = []
+        self.tasks = set()
+        self.reserved = set()  # (account, guild) pairs with a connect in progress
+
+    def start(self):
+        # Logs the accounts in on the running loop; called from on_ready, so
+        # only the first call does anything
+        if self.clients or not self.tokens:
+            return
+        intents = discord.Intents.none()
+        intents.guilds = True
+        intents.voice_states = True
+        for token in self.tokens:
+            bot = discord.Client(intents=intents)
+            self.clients.append(bot)
+            task = asyncio.create_task(bot.start(token))
+            self.tasks.add(task)
+            task.add_done_callback(self._stopped)
+
+    def _stopped(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            e = task.exception()
+            traceback.print_exception(type(e), e, e.__traceback__)
+
+    def free(self, client, guild_id):
+        # Accounts able to join a room in the guild right now, main bot first
+        for bot in (client, *self.clients):
+            if bot is not client and not bot.is_ready():
+                continue
+            guild = bot.get_guild(guild_id)
+            if guild is not None and guild.voice_client is None and (bot.user.id, guild_id) not in self.reserved:
+                yield bot
+
+    async def connect(self, client, channel, **kwargs):
+        # Joins `channel` with the first free account that can see it; None if
+        # every account is already recording a room in this server
+        guild_id = channel.guild.id
+        for bot in self.free(client, guild_id):
+            room = bot.get_channel(channel.id)
+            if room is None:
+                continue
+            key = (bot.user.id, guild_id)
+            self.reserved.add(key)
+            try:
+                return await room.connect(**kwargs)
+            finally:
+                self.reserved.discard(key)
+        return None
+
+    async def close(self):
+        for bot in self.clients:
+            await bot.close()
+
+voice_bots = VoiceBots(VOICE_BOT_TOKENS)
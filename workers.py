@@ -0,0 +1,90 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import WORKER_PROCESSES, OPENAI_MODEL, COMPACT_MESSAGE_TOKENS
+from audio import pcm_buffer, wav_for_upload
+from compact import compact
+from tokens import use_model
+import metrics
+
+# CPU-bound stages (audio conditioning and WAV encoding, transcript
+# compaction) run in local worker processes so they never hold the GIL the
+# Discord gateway and its heartbeats need. Network I/O (model calls, Discord
+# sends) stays on the event loop, where it is cheap. WORKER_PROCESSES=0 runs
+# the same functions in threads of this process instead.
+#
+# Workers are spawned, not forked: the gateway process has the voice receive
+# threads and open sockets that a fork would copy mid-use. Jobs cross the
+# pipe pickled, so arguments must be plain data (bytes, not buffer views).
+
+class WorkerPool:
+    def __init__(self, processes):
+        self.processes = processes
+        self.pending = 0
+        self.restarts = 0
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                self.processes, mp_context=multiprocessing.get_context("spawn"),
+                initializer=use_model, initargs=(OPENAI_MODEL,),
+            )
+        return self._pool
+
+    def start(self):
+        # Spawning imports numpy and the config in every worker; do it up front
+        # rather than on the first live segment
+        if self.processes and self._pool is None:
+            pool = self._executor()
+            for _ in range(self.processes):
+                pool.submit(int)
+
+    async def run(self, fn, *args):
+        self.pending += 1
+        try:
+            if not self.processes:
+                return await asyncio.to_thread(fn, *args)
+            loop = asyncio.get_running_loop()
+            pool = self._executor()
+            try:
+                return await loop.run_in_executor(pool, fn, *args)
+            except BrokenProcessPool:
+                # a worker died (OOM, signal); replace the pool and retry once.
+                # Jobs that failed together share the broken pool: only the
+                # first shuts it down, the rest retry on its replacement.
+                if self._pool is pool:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    self._pool = None
+                    self.restarts += 1
+                return await loop.run_in_executor(self._executor(), fn, *args)
+        finally:
+            self.pending -= 1
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+pool = WorkerPool(WORKER_PROCESSES)
+metrics.collector("worker_jobs", "gauge", "CPU jobs running or waiting for a worker.", lambda: pool.pending)
+
+async def condition_audio(frames):
+    # WAV upload buffer for one speaker's PCM. A worker maps a spooled buffer
+    # by its path and needs its own copy of anything else; what comes back is
+    # 16 kHz mono, a sixth of what went in.
+    if not pool.processes:
+        return await pool.run(wav_for_upload, frames)
+    path = frames.spooled_path() if hasattr(frames, "spooled_path") else None
+    if path:
+        return await pool.run(wav_for_upload, path)
+    buf = pcm_buffer(frames)
+    try:
+        pcm = bytes(buf)
+    finally:
+        buf.release()
+    return await pool.run(wav_for_upload, pcm)
+
+async def compact_turns(turns, budget=None):
+    return await pool.run(compact, turns, budget, COMPACT_MESSAGE_TOKENS)